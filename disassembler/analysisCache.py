@@ -0,0 +1,172 @@
+import hashlib
+import io
+import os
+import pickle
+
+from rom import ROM
+from romInfo import RomInfo
+
+
+CACHE_VERSION = 2
+
+
+def _hashFile(filename):
+    h = hashlib.md5()
+    with open(filename, "rb") as f:
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def _hashPython(path):
+    h = hashlib.md5()
+    # Sorting dirs in place makes os.walk visit the directories in a fixed order.
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith(".py"):
+                h.update(filename.encode("utf-8"))
+                with open(os.path.join(root, filename), "rb") as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+
+# Hash of the information from the sources that has an effect on processRom: the labels and the annotations.
+# Normal comments and includes are only used for the export, so changing those does not invalidate the cache.
+# Returns None when there is no such information, like for a rom bank that only has comments.
+def _memoryFingerprint(memory):
+    h = hashlib.md5()
+    empty = True
+    for addr, label in sorted(memory.getAllLabels(), key=lambda item: item[0]):
+        h.update(("L%x:%s\n" % (addr, label)).encode("utf-8"))
+        empty = False
+    for addr, comments in sorted(memory.getAllComments(), key=lambda item: item[0]):
+        for comment in comments:
+            if comment.startswith("@"):
+                h.update(("A%x:%s\n" % (addr, comment)).encode("utf-8"))
+                empty = False
+    for addr, comment in sorted(memory.getAllInlineComments(), key=lambda item: item[0]):
+        if comment.startswith("@"):
+            h.update(("I%x:%s\n" % (addr, comment)).encode("utf-8"))
+            empty = False
+    if empty:
+        return None
+    return h.hexdigest()
+
+
+# Name of a memory by its key, without creating rom banks that do not exist.
+def _memoryName(key):
+    if key[0] == "rom":
+        return "rom%x" % (key[1])
+    return RomInfo.getOtherMemories()[key[1]].type
+
+
+# Fingerprints of the memories that exist, by RomInfo.memoryKey. The rom banks that exist depend on which sources
+# were read, so memories without a fingerprint are left out.
+def _fingerprints():
+    fingerprints = {}
+    for memory in RomInfo.getAllMemories():
+        fingerprint = _memoryFingerprint(memory)
+        if fingerprint is not None:
+            fingerprints[RomInfo.memoryKey(memory)] = fingerprint
+    return fingerprints
+
+
+class _Pickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        # The rom data itself is never stored in the cache, it is identified by its md5 in the cache key.
+        if isinstance(obj, ROM):
+            return "rom"
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, f, rom):
+        super().__init__(f)
+        self.__rom = rom
+
+    def persistent_load(self, pid):
+        if pid == "rom":
+            return self.__rom
+        raise pickle.UnpicklingError("Unknown persistent id: %s" % (pid))
+
+
+# On disk cache of the state after Disassembler.processRom, so unchanged projects can skip straight to the export.
+# The cache is keyed by the rom md5, the instrumentation files, the plugins, the disassembler code itself, the trace mode,
+# as parallel tracing can give different results than serial tracing, and a fingerprint of the labels and annotations in the sources for every memory.
+# As code tracing crosses between banks, any change in the fingerprints invalidates the whole analysis.
+class AnalysisCache:
+    def __init__(self, filename, rom, *, wram_banks, instrumentation_files, instrumentation_ignore_banks, plugins, trace_jobs):
+        self.__filename = filename
+        self.__rom = rom
+
+        key = ["v%d" % (CACHE_VERSION), rom.md5sum(), "wram%d" % (wram_banks), _hashPython(os.path.dirname(os.path.abspath(__file__)))]
+        for filename in instrumentation_files:
+            key.append("i" + _hashFile(filename))
+        key.append("ignore:" + instrumentation_ignore_banks)
+        for plugin in plugins:
+            if os.path.isdir(plugin):
+                key.append("p" + _hashPython(plugin))
+            else:
+                key.append("p" + _hashFile(plugin))
+        key.append("trace:parallel" if trace_jobs > 1 else "trace:serial")
+        self.__key = "|".join(key)
+        self.__fingerprints = None
+        self.__data = None
+
+    # Fingerprint the sources, this needs to be done after the sources are read and before processRom.
+    def fingerprintSources(self):
+        self.__fingerprints = _fingerprints()
+
+    # Replace the RomInfo state with the cached analysis, if the cache is valid. Returns True on success.
+    def load(self):
+        if not os.path.exists(self.__filename):
+            print("Analysis cache: no cache found")
+            return False
+        try:
+            with open(self.__filename, "rb") as f:
+                cached = _Unpickler(f, self.__rom).load()
+        except Exception as e:
+            print("Analysis cache: failed to load (%s)" % (e))
+            return False
+        if cached["key"] != self.__key:
+            print("Analysis cache: rom, instrumentation, plugins, trace mode or disassembler changed")
+            return False
+        if cached["fingerprints"] != self.__fingerprints:
+            changed = sorted(key for key in set(cached["fingerprints"]) | set(self.__fingerprints) if cached["fingerprints"].get(key) != self.__fingerprints.get(key))
+            print("Analysis cache: labels or annotations changed in: %s, analysing the whole rom again" % (", ".join(_memoryName(key) for key in changed)))
+            return False
+
+        # The sources are read fresh every run, keep the comments and includes from those.
+        memories = [(RomInfo.memoryKey(memory), memory) for memory in RomInfo.getAllMemories()]
+        RomInfo.setState(cached["state"])
+        for key, memory in memories:
+            RomInfo.memoryByKey(key).takeSourceInfo(memory)
+        print("Analysis cache: using cached analysis")
+        return True
+
+    # Take a snapshot of the analysis, this needs to be done right after processRom, as the export modifies labels.
+    def snapshot(self):
+        cached = {"key": self.__key, "fingerprints": self.__fingerprints, "state": RomInfo.getState()}
+        f = io.BytesIO()
+        try:
+            _Pickler(f, pickle.HIGHEST_PROTOCOL).dump(cached)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            # Blocks from plugins loaded as a single file cannot be stored, as their module cannot be imported again.
+            print("Analysis cache: cannot store the analysis (%s)" % (e))
+            self.__data = None
+            return
+        self.__data = f.getvalue()
+
+    # Write the snapshot to disk. Done after the export, so the export still creates the output folder from the template.
+    def save(self):
+        if self.__data is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.__filename)), exist_ok=True)
+        tmp_filename = self.__filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(self.__data)
+        os.replace(tmp_filename, self.__filename)
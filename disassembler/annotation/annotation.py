@@ -38,4 +38,5 @@ def getAnnotation(memory, addr, comment):
     def f():
         handler(memory, addr, *args, **kwargs)
     f.priority = handler.priority
+    f.name = handler_name
     return f
@@ -44,6 +44,7 @@ class SdccFarrcallInfoBlock(Block):
         if target_block is None:
             target_block = CodeBlock(target_memory, self.__target_address)
         target_block.addAutoLabel(self.__target_address, address, "call")
+        target_memory.addXref(self.__target_address, memory.bankNumber, address, "farcall")
 
     def export(self, file):
         try:
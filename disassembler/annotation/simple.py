@@ -155,12 +155,20 @@ class DataBlock(Block):
                         target = (target >> 8) | ((target << 8) & 0xFF00)
                     if target >= memory.base_address and target < memory.base_address + len(memory):
                         memory.addAutoLabel(target, addr, "data")
+                        memory.addXref(target, memory.bankNumber, addr + len(self) + size, "ptr")
                     size += 2
             if n == 0:
                 for offset in range(1, size):
                     RelativeLabel(memory, addr + len(self) + offset, addr)
             self.resize(len(self) + size)
 
+    @property
+    def format(self):
+        return self.__format
+
+    @property
+    def amount(self):
+        return self.__amount
 
     def export(self, file):
         for n in range(self.__amount):
@@ -207,15 +215,17 @@ class JumpTable(Block):
             if not self.resize(len(self) + 2, allow_fail=amount is None):
                 break
             target = memory.word(addr + len(self) - 2)
+            target_memory = None
             if target >= memory.base_address and target < memory.base_address + len(memory) and target != 0x0000:
-                CodeBlock(memory, target)
-                memory.addAutoLabel(target, addr, "call")
+                target_memory = memory
             elif target >= 0x0100 and target < 0x4000:
-                CodeBlock(RomInfo.romBank(0), target)
-                RomInfo.romBank(0).addAutoLabel(target, addr, "call")
+                target_memory = RomInfo.romBank(0)
             elif target >= 0x4000 and target < 0x8000 and bank is not None:
-                CodeBlock(RomInfo.romBank(bank), target)
-                RomInfo.romBank(bank).addAutoLabel(target, addr, "call")
+                target_memory = RomInfo.romBank(bank)
+            if target_memory is not None:
+                CodeBlock(target_memory, target)
+                target_memory.addAutoLabel(target, addr, "call")
+                target_memory.addXref(target, memory.bankNumber, addr + len(self) - 2, "jumptable")
 
     def export(self, file):
         for n in range(len(self) // 2):
@@ -1,3 +1,4 @@
+import functools
 import re
 from annotation.annotation import annotation
 
@@ -13,6 +14,15 @@ def _formatNumberSigned(value):
 def _formatNumberHex(value):
     return f"${value:04x}"
 
+def _formatBank(target, value):
+    return f"BANK({target})"
+
+def _formatHigh(target, value):
+    return f"HIGH({target})"
+
+def _formatLow(target, value):
+    return f"LOW({target})"
+
 
 @annotation(name="=value", priority=10)
 def value(memory, addr, *, signed=False, hex=False):
@@ -51,7 +61,7 @@ def bank(memory, addr, target):
 
         ld a, BANK(data_02_4000) ;@=bank data_02_4000
     """
-    memory.setValueFormatFunction(addr, lambda n: f"BANK({target})")
+    memory.setValueFormatFunction(addr, functools.partial(_formatBank, target))
 
 @annotation(name="=high", priority=10)
 def bank(memory, addr, target):
@@ -60,7 +70,7 @@ def bank(memory, addr, target):
 
         ld a, HIGH(data_02_4000) ;@=high data_02_4000
     """
-    memory.setValueFormatFunction(addr, lambda n: f"HIGH({target})")
+    memory.setValueFormatFunction(addr, functools.partial(_formatHigh, target))
 
 @annotation(name="=low", priority=10)
 def bank(memory, addr, target):
@@ -69,5 +79,5 @@ def bank(memory, addr, target):
 
         ld a, LOW(data_02_4000) ;@=low data_02_4000
     """
-    memory.setValueFormatFunction(addr, lambda n: f"LOW({target})")
+    memory.setValueFormatFunction(addr, functools.partial(_formatLow, target))
 
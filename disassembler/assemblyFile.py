@@ -1,28 +1,77 @@
+import locale
 import os
 from memory.rom import RomMemory
 from memory.ram import WRamMemoryBanked
 
 
+MAX_XREF_COMMENT = 10
+
+
+class WriteStatistics:
+    def __init__(self):
+        self.written = 0
+        self.unchanged = 0
+
+    def report(self):
+        print("Wrote %d files, %d files were unchanged" % (self.written, self.unchanged))
+
+
+write_statistics = WriteStatistics()
+
+
+# Write data (text or bytes) to a file, unless the file already has exactly this content. Unchanged files keep
+# their modification time, so make does not rebuild what depends on them. Returns True when the file was written.
+# With atomic, the file is written under a temporary name first, so an interrupted export never leaves a partial file.
+def writeFileIfChanged(filename, data, *, atomic=False):
+    if isinstance(data, str):
+        # The same bytes as writing the text to a file opened with "wt".
+        data = data.replace("\n", os.linesep).encode(locale.getpreferredencoding(False))
+    if os.path.isfile(filename) and os.path.getsize(filename) == len(data):
+        with open(filename, "rb") as f:
+            if f.read() == data:
+                write_statistics.unchanged += 1
+                return False
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename = filename + ".tmp" if atomic else filename
+    with open(tmp_filename, "wb") as f:
+        f.write(data)
+    if atomic:
+        os.replace(tmp_filename, filename)
+    write_statistics.written += 1
+    return True
+
+
+# The output is collected in memory, and written to the file in one go by close(), if it differs from the existing file.
 class AssemblyFile:
-    def __init__(self, basepath, filename, memory=None, *, addr=None):
-        fullfilename = os.path.join(basepath, filename)
-        os.makedirs(os.path.dirname(fullfilename), exist_ok=True)
-        self.__file = open(fullfilename, "wt")
-        self.__file.write(";; Disassembled with BadBoy Disassembler: https://github.com/daid/BadBoy\n")
-        self.__file.write("\n")
+    def __init__(self, basepath, filename, memory=None, *, addr=None, xref_comments=False, atomic=False):
+        self.__filename = os.path.join(basepath, filename)
+        self.__atomic = atomic
+        self.__lines = []
+        self.__write = self.__lines.append
+        self.__write(";; Disassembled with BadBoy Disassembler: https://github.com/daid/BadBoy\n")
+        self.__write("\n")
         if addr is None:
-            self.__file.write("INCLUDE \"include/hardware.inc\"\n")
-            self.__file.write("INCLUDE \"include/macros.inc\"\n")
-            self.__file.write("INCLUDE \"include/charmaps.inc\"\n")
-            self.__file.write("INCLUDE \"include/constants.inc\"\n")
+            self.__write("INCLUDE \"include/hardware.inc\"\n")
+            self.__write("INCLUDE \"include/macros.inc\"\n")
+            self.__write("INCLUDE \"include/charmaps.inc\"\n")
+            self.__write("INCLUDE \"include/constants.inc\"\n")
         self.addr = addr
         self.__memory = None
         self.__addr_prefix = None
-        self.__last_label = "NONE"
+        self.__last_scope = "NONE"
         self.basepath = basepath
+        self.xref_comments = xref_comments
+        self.atomic = atomic
         if memory is not None:
             self.setMemory(memory)
 
+    def close(self):
+        if self.__lines is None:
+            return
+        writeFileIfChanged(self.__filename, "".join(self.__lines), atomic=self.__atomic)
+        self.__lines = None
+        self.__write = None
+
     def setMemory(self, memory):
         self.__memory = memory
         if isinstance(self.__memory, RomMemory):
@@ -38,39 +87,54 @@ class AssemblyFile:
         else:
             self.addr = addr
 
-        self.__file.write("\n")
+        self.__write("\n")
         if isinstance(self.__memory, RomMemory):
             if sectionname is None:
                 sectionname = "bank%02x" % (self.__memory.bankNumber)
                 if self.addr != self.__memory.base_address:
                     sectionname = "%s_%04x" % (sectionname, self.addr)
             if self.__memory.bankNumber == 0:
-                self.__file.write("SECTION \"%s\", ROM0[$%04x]\n" % (sectionname, self.addr))
+                self.__write("SECTION \"%s\", ROM0[$%04x]\n" % (sectionname, self.addr))
             else:
-                self.__file.write("SECTION \"%s\", ROMX[$%04x], BANK[$%02x]\n" % (sectionname, self.addr, self.__memory.bankNumber))
+                self.__write("SECTION \"%s\", ROMX[$%04x], BANK[$%02x]\n" % (sectionname, self.addr, self.__memory.bankNumber))
             self.__addr_prefix = "%02x:" % (self.__memory.bankNumber)
         elif isinstance(self.__memory, WRamMemoryBanked) and self.__memory.bankNumber != 0:
             if addr is None:
-                self.__file.write("SECTION \"wram%01x\", WRAMX[$%04x], BANK[$%01x]\n" % (self.__memory.bankNumber, self.__memory.base_address, self.__memory.bankNumber))
+                self.__write("SECTION \"wram%01x\", WRAMX[$%04x], BANK[$%01x]\n" % (self.__memory.bankNumber, self.__memory.base_address, self.__memory.bankNumber))
             self.__addr_prefix = ""
         else:
             if addr is None:
-                self.__file.write("SECTION \"%s\", %s[$%04x]\n" % (self.__memory.type.lower(), self.__memory.type.upper(), self.__memory.base_address))
+                self.__write("SECTION \"%s\", %s[$%04x]\n" % (self.__memory.type.lower(), self.__memory.type.upper(), self.__memory.base_address))
             self.__addr_prefix = ""
 
+    # Section of a padding bank that has no RomMemory, see Disassembler.__exportPaddingBank.
+    def startPaddingBankSection(self, bank_nr):
+        self.addr = 0x4000
+        self.__addr_prefix = "%02x:" % (bank_nr)
+        self.__write("\n")
+        self.__write("SECTION \"bank%02x\", ROMX[$%04x], BANK[$%02x]\n" % (bank_nr, self.addr, bank_nr))
+
     def newline(self):
-        self.__file.write("\n")
+        self.__write("\n")
 
     def comment(self, line):
-        self.__file.write("    ;;%s\n" % (line))
+        self.__write("    ;;%s\n" % (line))
     
     def label(self, label):
         if not label.startswith("."):
-            self.__last_label = label
-        self.__file.write("%s:\n" % (label))
+            self.__last_scope = label.split(".")[0]
+        self.__write("%s:\n" % (label))
+
+    def xrefComment(self, xrefs):
+        if not xrefs:
+            return
+        refs = ["%s %02x:%04x" % (kind, source_bank, source_addr) for source_bank, source_addr, kind in xrefs[:MAX_XREF_COMMENT]]
+        if len(xrefs) > MAX_XREF_COMMENT:
+            refs.append("(+%d more)" % (len(xrefs) - MAX_XREF_COMMENT))
+        self.comment(" xrefs: %s" % (", ".join(refs)))
 
     def include(self, filename):
-        self.__file.write('\nINCLUDE "%s"\n' % (filename))
+        self.__write('\nINCLUDE "%s"\n' % (filename))
 
     def asmLine(self, size, code, *args, is_data=False, add_data_comment=True, comment=None):
         if args:
@@ -80,51 +144,66 @@ class AssemblyFile:
         if section is not None:
             self.startSection(addr=self.addr, sectionname=section)
 
-        label = self.__memory.getLabel(self.addr)
+        label = self.__memory.getLabelString(self.addr)
         if label:
-            label = str(label)
-            if "." in label and self.__last_label.split(".")[0] == label.split(".")[0]:
-                label = "." + label.split(".", 1)[1]
+            dot = label.find(".")
+            if dot > 0 and label[:dot] == self.__last_scope:
+                label = label[dot:]
             if not label.startswith("."):
-                self.__file.write("\n")
+                self.__write("\n")
         comments = self.__memory.getComments(self.addr)
         if comments:
             for c in comments:
-                self.__file.write(";%s\n" % (c))
+                self.__write(";%s\n" % (c))
         if label:
             self.label(label)
+            if self.xref_comments:
+                self.xrefComment(self.__memory.getXrefs(self.addr))
 
         inline_comment = self.__memory.getInlineComment(self.addr)
         if inline_comment:
             code = "%s ;%s" % (code,inline_comment)
 
-        self.__file.write("    %-50s ;; %s%04x" % (code, self.__addr_prefix, self.addr))
+        line = "    %-50s ;; %s%04x" % (code, self.__addr_prefix, self.addr)
         if isinstance(self.__memory, RomMemory) and add_data_comment:
             if is_data:
-                self.__file.write(" ")
+                marks = [" "]
                 for n in range(size):
                     if self.__memory.hasMark(self.addr+n, "PTR_LOW"):
-                        self.__file.write("p")
+                        marks.append("p")
                     elif self.__memory.hasMark(self.addr+n, "PTR_HIGH"):
-                        self.__file.write("P")
+                        marks.append("P")
                     elif self.__memory.hasMark(self.addr+n, "WORD_LOW"):
-                        self.__file.write("w")
+                        marks.append("w")
                     elif self.__memory.hasMark(self.addr+n, "WORD_HIGH"):
-                        self.__file.write("W")
+                        marks.append("W")
                     elif self.__memory.hasMark(self.addr+n, "DATA"):
-                        self.__file.write(".")
+                        marks.append(".")
                     else:
-                        self.__file.write("?")
+                        marks.append("?")
+                line += "".join(marks)
             else:
-                for n in range(size):
-                    self.__file.write(" $%02x" % (self.__memory.byte(self.addr+n)))
+                line += "".join([" $%02x" % (n) for n in self.__memory.data(self.addr, size)])
                 #for n in range(size):
                 #    s = self.info.classifyData(address+n)
                 #    if s:
                 #        output.write(" %s" % (s))
         if comment is not None:
-            self.__file.write(" %s" % (comment))
-        self.__file.write("\n")
+            line += " %s" % (comment)
+        self.__write(line + "\n")
+        self.addr += size
+
+    # Same output as calling dataLine for every 8 bytes, but only valid if the memory is bare (see Memory.isBare).
+    # Padding banks without a memory give their data.
+    def dataLines(self, size, *, data=None):
+        if data is None:
+            data = self.__memory.data(self.addr, size)
+        lines = []
+        for offset in range(0, size, 8):
+            chunk = data[offset:offset+8]
+            code = "db   " + ", ".join(["$%02x" % (n) for n in chunk])
+            lines.append("    %-50s ;; %s%04x %s\n" % (code, self.__addr_prefix, self.addr + offset, "?" * len(chunk)))
+        self.__write("".join(lines))
         self.addr += size
 
     def dataLine(self, size):
@@ -1,3 +1,4 @@
+import bisect
 
 
 class AutoLabel:
@@ -6,9 +7,24 @@ class AutoLabel:
         self.address = address
         self.source_types = set()
         self.source_addresses = set()
-        self.local = None
+        self.__local = None
+        # The rendered name, which only changes when a source is added or local changes. Both also drop the label
+        # strings that the memory rendered for the export.
+        self.__name = None
  
+    @property
+    def local(self):
+        return self.__local
+
+    @local.setter
+    def local(self, value):
+        self.__local = value
+        self.__name = None
+        self.memory.dropLabelScopes()
+
     def addSource(self, address, type):
+        self.__name = None
+        self.memory.dropLabelScopes()
         self.source_types.add(type)
         if address is not None:
             self.source_addresses.add(address)
@@ -19,6 +35,11 @@ class AutoLabel:
             self.local = False
 
     def __str__(self):
+        if self.__name is None:
+            self.__name = self.__render()
+        return self.__name
+
+    def __render(self):
         prefix = "data"
         if "call" in self.source_types:
             prefix = "call"
@@ -55,13 +76,24 @@ class RelativeLabel:
             return "%s - $%02x" % (label, -offset)
         return "%s + $%02x" % (label, offset)
 
+# Decides which auto labels become local labels. An auto label is local, unless it is called, it is the first label of the
+# memory, or the range between the label and its sources contains a global label or an auto label that is not local.
+# As removing one local label can remove others, labels that are not local are spread with a worklist over the labels
+# whose range contains them. Ranges are found with bisect on the sorted label addresses, and global labels are counted
+# with prefix sums, so this is O(n log n) in the number of labels, independent of the size of the ranges.
 class AutoLabelLocalizer:
     def __init__(self, memory):
-        self.__memory = memory
-        self.__blocks_labels = {}
-        
+        labels = sorted(memory.getAllLabels())
+        addrs = [addr for addr, _ in labels]
+        global_count = [0]
+        for _, label in labels:
+            global_count.append(global_count[-1] + (isinstance(label, str) and "." not in label))
+
+        # For every auto label that can still become local, the [start, end) range of indices in labels between it and its sources.
+        candidates = []
+        not_local = []
         first = True
-        for _, label in sorted(memory.getAllLabels()):
+        for index, (addr, label) in enumerate(labels):
             if isinstance(label, str):
                 first = False
             if not isinstance(label, AutoLabel):
@@ -69,44 +101,71 @@ class AutoLabelLocalizer:
             if first:
                 first = False
                 label.local = False
-            self.__processLabel(label)
-    
-    def __processLabel(self, auto_label):
-        if auto_label.local == False:
-            return
-    
-        source_min = auto_label.address
-        source_max = auto_label.address
-        
-        for source in auto_label.source_addresses:
-            source_min = min(source_min, source)
-            source_max = max(source_max, source)
-        
-        labels = set()
-        for addr in range(source_min, source_max + 1):
-            label = self.__memory.getLabel(addr)
-            if label is None:
+            if label.local == False:
+                not_local.append(index)
                 continue
-            if isinstance(label, str):
-                if "." not in label:
-                    self.__removeLocal(auto_label)
-                    return
-            elif isinstance(label, AutoLabel):
-                if label.local == False:
-                    self.__removeLocal(auto_label)
-                    return
-            labels.add(label)
-
-        auto_label.local = True
-        for label in labels:
-            if label not in self.__blocks_labels:
-                self.__blocks_labels[label] = set()
-            self.__blocks_labels[label].add(auto_label)
-
-    def __removeLocal(self, auto_label):
-        auto_label.local = False
-        if auto_label in self.__blocks_labels:
-            labels = self.__blocks_labels[auto_label]
-            del self.__blocks_labels[auto_label]
-            for label in labels:
-                self.__removeLocal(label)
+            start = bisect.bisect_left(addrs, min(label.source_addresses, default=addr), hi=index)
+            end = bisect.bisect_right(addrs, max(label.source_addresses, default=addr), lo=index + 1)
+            if global_count[end] - global_count[start] > 0:
+                label.local = False
+                not_local.append(index)
+            else:
+                label.local = True
+                candidates.append((start, end, index))
+
+        # Every label that is not local makes all local labels that have it in their range not local.
+        candidates.sort()
+        ranges = _RangeSet([end for _, end, _ in candidates])
+        starts = [start for start, _, _ in candidates]
+        while not_local:
+            index = not_local.pop()
+            count = bisect.bisect_right(starts, index)
+            while True:
+                n = ranges.takeEndingAfter(count, index)
+                if n is None:
+                    break
+                label_index = candidates[n][2]
+                labels[label_index][1].local = False
+                not_local.append(label_index)
+
+
+# The ends of a list of ranges, from which ranges can be taken out by the position they contain.
+class _RangeSet:
+    def __init__(self, ends):
+        self.__size = 1
+        while self.__size < len(ends):
+            self.__size *= 2
+        # Segment tree of the largest end of every node, ranges that are taken out have an end of -1.
+        self.__tree = [-1] * (self.__size * 2)
+        self.__tree[self.__size:self.__size + len(ends)] = ends
+        for node in range(self.__size - 1, 0, -1):
+            self.__tree[node] = max(self.__tree[node * 2], self.__tree[node * 2 + 1])
+
+    # Take out one of the first count ranges that ends after position, and return its index, or None.
+    def takeEndingAfter(self, count, position):
+        tree = self.__tree
+        # The first count ranges are covered by at most two nodes per level, look for one with a range ending after position.
+        node = None
+        left, right = self.__size, self.__size + count
+        while left < right and node is None:
+            if left & 1:
+                if tree[left] > position:
+                    node = left
+                left += 1
+            if right & 1 and node is None:
+                right -= 1
+                if tree[right] > position:
+                    node = right
+            left //= 2
+            right //= 2
+        if node is None:
+            return None
+        while node < self.__size:
+            node = node * 2 if tree[node * 2] > position else node * 2 + 1
+        index = node - self.__size
+        tree[node] = -1
+        node //= 2
+        while node:
+            tree[node] = max(tree[node * 2], tree[node * 2 + 1])
+            node //= 2
+        return index
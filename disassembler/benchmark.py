@@ -0,0 +1,55 @@
+import argparse
+import os
+import tempfile
+import timeit
+
+from rom import ROM
+from memory.rom import RomMemory
+from instruction import Instruction, InstructionDecodeError
+from instructionIndex import InstructionIndex
+
+
+def decodeBank(memory):
+    # Decode an instruction at every address of the bank, like the worst case of tracing a bank full of code.
+    # The last 2 bytes are skipped, as operands could be read past the end of the rom there.
+    count = 0
+    for addr in range(memory.base_address, memory.base_address + len(memory) - 2):
+        try:
+            Instruction(memory, addr)
+            count += 1
+        except InstructionDecodeError:
+            pass
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the disassembler hot paths.")
+    parser.add_argument("rom", type=str, nargs="?", help="Rom to benchmark on, uses a synthetic bank with every opcode when not given")
+    parser.add_argument("--bank", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mmap", action="store_true", help="Map the rom file instead of reading it")
+    args = parser.parse_args()
+
+    if args.rom:
+        memory = RomMemory(ROM(args.rom, use_mmap=args.mmap), args.bank)
+    else:
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, "synthetic.gb")
+            open(filename, "wb").write(bytes(range(256)) * 0x80)
+            memory = RomMemory(ROM(filename, use_mmap=args.mmap), args.bank)
+
+    count = decodeBank(memory)
+    best = min(timeit.repeat(lambda: decodeBank(memory), number=1, repeat=args.repeat))
+    print("decode: %d instructions in bank %02x, %.1f ms per bank, %.2f us per instruction" % (count, memory.bankNumber, best * 1000, best * 1000000 / count))
+
+    best = min(timeit.repeat(lambda: InstructionIndex(memory), number=1, repeat=args.repeat))
+    print("index:  %d addresses in bank %02x, %.1f ms per bank" % (len(memory), memory.bankNumber, best * 1000))
+
+    best = min(timeit.repeat(lambda: [memory.word(addr) for addr in range(memory.base_address, memory.base_address + len(memory), 2)], number=1, repeat=args.repeat))
+    print("word:   %.1f ms per bank" % (best * 1000))
+    best = min(timeit.repeat(lambda: memory.words(memory.base_address, len(memory) // 2).tolist(), number=1, repeat=args.repeat))
+    print("words:  %.1f ms per bank" % (best * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -25,19 +25,17 @@ class Block:
     def resize(self, new_size, *, allow_fail=False, allow_shrink=False):
         if allow_shrink and new_size < self.__size:
             assert new_size >= 0
-            for n in range(new_size, self.__size):
-                self.__memory[n + self.__base_address] = None
+            self.__memory.releaseBlockRange(self.__base_address + new_size, self.__base_address + self.__size)
             self.__size = new_size
             return True
         assert new_size >= self.__size
         if allow_fail:
             if self.__base_address + new_size > self.__memory.base_address + len(self.__memory):
                 return False
-            for n in range(self.__size, new_size):
-                if self.__memory[n + self.__base_address]:
-                    return False
-        for n in range(self.__size, new_size):
-            self.__memory[n + self.__base_address] = self
+            if not self.__memory.isFreeBlockRange(self.__base_address + self.__size, self.__base_address + new_size):
+                return False
+        if new_size > self.__size:
+            self.__memory.claimBlockRange(self.__base_address + self.__size, self.__base_address + new_size, self)
         self.__size = new_size
         return True
 
@@ -1,3 +1,5 @@
+import time
+
 from .base import Block
 from instruction import *
 from romInfo import RomInfo
@@ -9,27 +11,110 @@ CART_CONTROL_REGS = {
 }
 
 
+class TraceStatistics:
+    def __init__(self):
+        self.entries = 0
+        self.blocks = 0
+        self.instructions = 0
+        self.max_depth = 0
+        self.time_per_bank = {}
+
+    def addTime(self, memory, seconds):
+        self.time_per_bank[memory.bankNumber] = self.time_per_bank.get(memory.bankNumber, 0.0) + seconds
+
+    def report(self):
+        print("Traced %d entries into %d code blocks with %d instructions, max worklist depth: %d" % (self.entries, self.blocks, self.instructions, self.max_depth))
+        slowest = sorted(self.time_per_bank.items(), key=lambda item: item[1], reverse=True)[:5]
+        if slowest:
+            print("Slowest banks to trace: %s" % (", ".join("%02x: %.3fs" % (bank, seconds) for bank, seconds in slowest)))
+
+
+# Raised when tracing is limited to a single memory, and tracing needs to call a hook of a CodeBlock subclass.
+class TraceScopeError(Exception):
+    pass
+
+
 class CodeBlock(Block):
-    def __init__(self, memory, address):
+    statistics = TraceStatistics()
+    # When set, tracing is limited to this memory. Targets in other memories are collected in cross_bank_targets
+    # as (memory, target, from_memory, from_addr, instr) instead of being traced. Used by parallel tracing.
+    trace_scope = None
+    cross_bank_targets = []
+    __worklist_nesting = 0
+
+    def __init__(self, memory, address, *, trace=True):
         super().__init__(memory, address)
-        
+
+        if trace:
+            self.__traceWorklist(address)
+
+    # Code reachable from this block is traced with an explicit worklist instead of recursion, so long call chains
+    # do not hit the recursion limit. Every entry is a (memory, address, origin) trace that is still in progress,
+    # new targets are traced depth first, which creates the exact same blocks as tracing them recursively.
+    def __traceWorklist(self, address):
+        CodeBlock.__worklist_nesting += 1
+        timed = CodeBlock.__worklist_nesting == 1
+        statistics = CodeBlock.statistics
+        worklist = [(self.memory, address, None, self.__trace(address))]
+        statistics.entries += 1
+        try:
+            while worklist:
+                memory, _, _, steps = worklist[-1]
+                if timed:
+                    start = time.perf_counter()
+                try:
+                    request = next(steps)
+                except StopIteration:
+                    request = None
+                    worklist.pop()
+                if timed:
+                    statistics.addTime(memory, time.perf_counter() - start)
+                if request is not None:
+                    other_memory, target, origin, instr = request
+                    if CodeBlock.trace_scope is not None and other_memory is not CodeBlock.trace_scope:
+                        CodeBlock.cross_bank_targets.append((other_memory, target, memory, origin, instr))
+                        continue
+                    block = CodeBlock(other_memory, target, trace=False)
+                    worklist.append((other_memory, target, origin, block.__trace(target)))
+                    statistics.entries += 1
+                    statistics.max_depth = max(statistics.max_depth, len(worklist))
+        finally:
+            CodeBlock.__worklist_nesting -= 1
+
+    # Traces instructions from the given address until the code flow ends.
+    # Yields (memory, address, origin, instr) for every target that is not part of any block yet,
+    # and expects that target to be traced before it is resumed.
+    def __trace(self, address):
+        memory = self.memory
+        index = memory.instructionIndex()
         while True:
             if address >= memory.base_address + 0x4000 or memory[address]:
                 break
 
-            try:
-                instr = Instruction(self.memory, address)
-            except InstructionDecodeError:
-                print("Encountered invalid instruction [%02x] in code at: %02x:%04x" % (memory.byte(address), memory.bankNumber, address))
-                break
-            if not self.resize(len(self) + instr.size, allow_fail=True):
+            # Plain instructions have no targets or addresses, only their size and code flow are taken from the index.
+            plain = index.isPlainAt(address)
+            if plain:
+                size = index.sizeAt(address)
+            else:
+                try:
+                    instr = memory.instruction(address)
+                except InstructionDecodeError:
+                    print("Encountered invalid instruction [%02x] in code at: %02x:%04x" % (memory.byte(address), memory.bankNumber, address))
+                    break
+                size = instr.size
+            if not self.resize(len(self) + size, allow_fail=True):
                 print("Odd instruction overlap at: %02x:%04x" % (memory.bankNumber, address))
                 break
+            CodeBlock.statistics.instructions += 1
 
-            for n in range(1, instr.size):
+            for n in range(1, size):
                 memory.ensureNoLabel(address + n)
-            address += instr.size
-            
+            address += size
+            if plain:
+                if not index.hasNextAt(address - size):
+                    break
+                continue
+
             target = instr.jumpTarget()
             if target != None and target < 0x8000:
                 if memory.bankNumber > 0:
@@ -40,12 +125,15 @@ class CodeBlock(Block):
                         active_bank = RomInfo.romBank(active_bank)
                 other_memory = RomInfo.memoryAt(target, active_bank)
                 if other_memory:
+                    other_memory.addXref(target, memory.bankNumber, address - instr.size, instr.type)
                     other_block = other_memory[target]
                     stop = False
                     if other_block is None:
-                        CodeBlock(other_memory, target)
+                        yield other_memory, target, address - instr.size, instr
                         other_block = other_memory[target]
                     elif isinstance(other_block, CodeBlock) and other_block.base_address == target:
+                        if CodeBlock.trace_scope is not None and type(other_block) is not CodeBlock:
+                            raise TraceScopeError("Hook of %s at %02x:%04x" % (other_block.__class__.__name__, other_memory.bankNumber, target))
                         if instr.type in (CALL, RST):
                             stop = other_block.onCall(self.memory, address - instr.size, address)
                         else:
@@ -58,31 +146,43 @@ class CodeBlock(Block):
                 mem = RomInfo.memoryAt(instr.p0.target, memory)
                 if mem:
                     mem.addAutoLabel(instr.p0.target, address, "data")
+                    mem.addXref(instr.p0.target, memory.bankNumber, address - instr.size, "write")
             elif isinstance(instr.p1, Ref) and isinstance(instr.p1.target, int):
                 mem = RomInfo.memoryAt(instr.p1.target, memory)
                 if mem:
                     mem.addAutoLabel(instr.p1.target, address, "data")
+                    mem.addXref(instr.p1.target, memory.bankNumber, address - instr.size, "read")
             elif instr.p0 in (BC, DE, HL) and isinstance(instr.p1, int) and not memory.hasValueFormatFunction(address - instr.size):
+                mem = None
                 if 0x4000 <= instr.p1 < 0x8000: # Banked ROM
                     if memory.hasMark(address - instr.size, "PTR_BANK"):
-                        m = RomInfo.romBank(memory.markValue(address - instr.size, "PTR_BANK"))
-                        m.addAutoLabel(instr.p1, None, "data")
+                        mem = RomInfo.romBank(memory.markValue(address - instr.size, "PTR_BANK"))
+                        mem.addAutoLabel(instr.p1, None, "data")
                     elif memory.bankNumber > 0:
-                        RomInfo.memoryAt(instr.p1, memory).addAutoLabel(instr.p1, address, "data")
+                        mem = RomInfo.memoryAt(instr.p1, memory)
+                        mem.addAutoLabel(instr.p1, address, "data")
                 elif 0xA000 <= instr.p1 < 0xC000: # SRAM
-                    RomInfo.memoryAt(instr.p1).addAutoLabel(instr.p1, address, "data")
+                    mem = RomInfo.memoryAt(instr.p1)
+                    mem.addAutoLabel(instr.p1, address, "data")
                 elif 0xC000 <= instr.p1 < 0xE000: # WRAM
-                    RomInfo.memoryAt(instr.p1).addAutoLabel(instr.p1, address, "data")
+                    mem = RomInfo.memoryAt(instr.p1)
+                    mem.addAutoLabel(instr.p1, address, "data")
                 elif 0xFF80 <= instr.p1 < 0xFFFF: # HRAM
-                    RomInfo.memoryAt(instr.p1).addAutoLabel(instr.p1, address, "data")
+                    mem = RomInfo.memoryAt(instr.p1)
+                    mem.addAutoLabel(instr.p1, address, "data")
+                if mem:
+                    mem.addXref(instr.p1, memory.bankNumber, address - instr.size, "ptr")
             if not instr.hasNext():
                 break
+        if len(self) > 0:
+            CodeBlock.statistics.blocks += 1
 
     def export(self, file):
         while file.addr < self.base_address + len(self):
-            self.outputInstruction(file, Instruction(self.memory, file.addr))
+            self.outputInstruction(file, self.memory.instruction(file.addr))
 
     def outputInstruction(self, file, instr):
+        instr_type = instr.type
         p0 = instr.p0
         p1 = instr.p1
         if instr.type in (JP, JR, CALL, RST) and p0 != HL:
@@ -90,10 +190,10 @@ class CodeBlock(Block):
 
         # Prevent the assembler from optimizing "LD [FFxx], A" and "LD A, [FFxx]" instructions.
         if instr.type == LD and isinstance(p0, Ref) and isinstance(p0.target, int) and p0.target >= 0xFF00 and instr.p1 == A:
-            instr.type = "ld_long_store"
+            instr_type = "ld_long_store"
             p0 = "%s" % (self.formatAsAddressOrLabel(p0.target, file.addr))
         elif instr.type == LD and isinstance(p1, Ref) and isinstance(p1.target, int) and p1.target >= 0xFF00 and instr.p0 == A:
-            instr.type = "ld_long_load"
+            instr_type = "ld_long_load"
             p1 = "%s" % (self.formatAsAddressOrLabel(p1.target, file.addr))
 
         if isinstance(p0, Ref) and isinstance(p0.target, int):
@@ -110,15 +210,15 @@ class CodeBlock(Block):
             p1 = self.formatAsNumberOrLabel(p1, file.addr)
 
         if instr.condition != None and instr.p0 != None:
-            file.asmLine(instr.size, instr.type, instr.condition, str(p0))
+            file.asmLine(instr.size, instr_type, instr.condition, str(p0))
         elif instr.p0 != None and instr.p1 != None:
-            file.asmLine(instr.size, instr.type, str(p0), str(p1))
+            file.asmLine(instr.size, instr_type, str(p0), str(p1))
         elif instr.p0 != None:
-            file.asmLine(instr.size, instr.type, str(p0))
+            file.asmLine(instr.size, instr_type, str(p0))
         elif instr.condition != None:
-            file.asmLine(instr.size, instr.type, instr.condition)
+            file.asmLine(instr.size, instr_type, instr.condition)
         else:
-            file.asmLine(instr.size, instr.type)
+            file.asmLine(instr.size, instr_type)
 
     def formatAsAddressOrLabel(self, target, source_addr):
         if self.memory.hasValueFormatFunction(source_addr):
@@ -128,13 +228,13 @@ class CodeBlock(Block):
             return self.memory.markValue(source_addr, "PTR_TARGET")
         if self.memory.hasMark(source_addr, "PTR_BANK"):
             rombank = self.memory.markValue(source_addr, "PTR_BANK")
-        label = RomInfo.getLabelAt(target, RomInfo.romBank(rombank))
+        target_memory = RomInfo.memoryAt(target, RomInfo.romBank(rombank))
+        label = target_memory.getLabelString(target) if target_memory else None
         if label:
-            label = str(label)
             dot = label.find(".")
             if dot > 0:
                 prefix = label[:dot]
-                if str(self.memory.getLabelBefore(source_addr, local=False)) == prefix:
+                if self.memory.getScopeLabelString(source_addr) == prefix:
                     return label[dot:]
             return label
         return "$%04x" % (target)
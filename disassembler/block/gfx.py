@@ -1,5 +1,7 @@
 from .base import Block
+from assemblyFile import writeFileIfChanged
 import PIL.Image
+import io
 import numpy
 import os
 
@@ -35,24 +37,16 @@ class GfxImageBlock(Block):
         self.height = height
 
     def export(self, file):
-        brightnesslookup = [255, 200, 100, 0]
-        addr = file.addr
-        img = numpy.zeros((self.height * 8, self.width * 8), dtype=numpy.uint8)
-        for y in range(self.height):
-            for x in range(self.width):
-                for row in range(8):
-                    a = self.memory.byte(addr)
-                    b = self.memory.byte(addr + 1)
-                    addr += 2
-                    for col in range(8):
-                        v = 0
-                        if a & (0x80 >> col):
-                            v |= 1
-                        if b & (0x80 >> col):
-                            v |= 2
-                        img[y*8+row, x*8+col] = brightnesslookup[v]
-        img = PIL.Image.fromarray(img, "L")
-        filename = os.path.join(file.basepath, "gfx", "%s.png" % (self.name))
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        img.save(filename)
+        brightnesslookup = numpy.array([255, 200, 100, 0], dtype=numpy.uint8)
+        # Tiles are stored as [tile y][tile x][row][low, high plane], unpack each plane into 8 pixels.
+        data = numpy.frombuffer(self.memory.bytesView(file.addr, len(self)), dtype=numpy.uint8)
+        data = data.reshape(self.height, self.width, 8, 2)
+        low = numpy.unpackbits(data[..., 0:1], axis=3)
+        high = numpy.unpackbits(data[..., 1:2], axis=3)
+        img = brightnesslookup[low | (high << 1)]
+        img = img.transpose(0, 2, 1, 3).reshape(self.height * 8, self.width * 8)
+        img = PIL.Image.fromarray(numpy.ascontiguousarray(img), "L")
+        png = io.BytesIO()
+        img.save(png, "png")
+        writeFileIfChanged(os.path.join(file.basepath, "gfx", "%s.png" % (self.name)), png.getvalue())
         file.asmLine(len(self), "INCBIN", "\"%s.bin\"" % (self.name), add_data_comment=False)
@@ -84,6 +84,9 @@ class ROMHeader(Block):
 class NoExport00(Block):
     def __init__(self, memory, end_addr):
         addr = end_addr - 1
+        # Fast path for untouched banks of $00 padding, this is where the loop below ends for those.
+        if end_addr == memory.base_address + len(memory) and memory.fillByte() == 0x00 and not memory.getAllLabels() and memory.nextClaimedAddress(memory.base_address) is None:
+            addr = memory.base_address
         while memory.byte(addr) == 0x00 and memory.getLabel(addr) == None and memory[addr] == None and addr > memory.base_address:
             addr -= 1
         addr += 1
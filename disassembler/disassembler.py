@@ -1,8 +1,11 @@
 import os
 import shutil
+import numpy
 
 from romInfo import RomInfo
-from assemblyFile import AssemblyFile
+from memory.rom import RomMemory
+from memory.ram import WRamMemoryBanked
+from assemblyFile import AssemblyFile, writeFileIfChanged, write_statistics
 from block.header import ROMHeader, NoExport00
 from block.code import CodeBlock
 from block.gfx import GfxBlock
@@ -10,6 +13,9 @@ from sourceReader import SourceReader
 from annotation.annotation import getAnnotation
 from autoLabel import AutoLabelLocalizer
 from annotation.simple import DataBlock
+from parallelTrace import traceBanksParallel
+from parallelExport import exportBanksParallel
+from profiler import Profiler
 
 
 class Disassembler:
@@ -18,19 +24,30 @@ class Disassembler:
         self.wram_banks = wram_banks
         RomInfo.init(rom, wram_banks)
 
-    def readSources(self, path):
+    # With a SourceCache, files that did not change since the previous run are not parsed again.
+    def readSources(self, path, *, cache=None):
         if os.path.exists(os.path.join(path, "src")):
             for filename in os.listdir(os.path.join(path, "src")):
                 if not filename.endswith(".asm"):
                     continue
                 
-                SourceReader(path).readFile(os.path.join("src", filename))
+                SourceReader(path, cache=cache).readFile(os.path.join("src", filename))
+        # Parts of banks that were split into separate files by the export, these are not the main file of their bank.
+        if os.path.exists(os.path.join(path, "src", "split")):
+            for filename in os.listdir(os.path.join(path, "src", "split")):
+                if not filename.endswith(".asm"):
+                    continue
+
+                SourceReader(path, cache=cache).readFile(os.path.join("src", "split", filename), main=False)
+        if cache is not None and cache.hits + cache.misses > 0:
+            print("Source cache: %d files unchanged, %d files parsed" % (cache.hits, cache.misses))
 
-    def processRom(self):
+    def processRom(self, *, jobs=1):
         print("Processing rom...")
         # First process all the annotations
         annotations = []
-        for bank in RomInfo.getRomBanks():
+        # Only banks that exist can have annotations, the sources that were read created those.
+        for bank in RomInfo.existingRomBanks():
             for addr, comments in bank.getAllComments():
                 for comment in comments:
                     if comment.startswith("@"):
@@ -39,114 +56,302 @@ class Disassembler:
                 if comment.startswith("@"):
                     annotations.append(getAnnotation(bank, addr, comment[1:]))
         annotations.sort(key=lambda a: a.priority)
-        for annotation in annotations:
-            annotation()
+        with Profiler.phase("annotations"):
+            for annotation in annotations:
+                with Profiler.item("annotation", annotation.name):
+                    annotation()
 
         # Next process our normal entry point, header info and interrupts.
-        ROMHeader(RomInfo.romBank(0))
-        if RomInfo.romBank(0)[0x0100] is None:
-            NoExport00(RomInfo.romBank(0), 0x100)
-            RomInfo.romBank(0).addSectionStart(0x100, "entry")
-            CodeBlock(RomInfo.romBank(0), 0x0100).addLabel(0x0100, "entry")
-            RomInfo.romBank(0).addSectionStart(0x150, "bank00_0150")
-
-        for addr, name in [(0x0040, "isrVBlank"), (0x0048, "isrLCDC"), (0x0050, "isrTimer"), (0x0058, "isrSerial"), (0x0060, "isrJoypad")]:
-            if RomInfo.memoryAt(addr).byte(addr) not in (0x00, 0xff) and RomInfo.memoryAt(addr)[addr] == None:
-                NoExport00(RomInfo.romBank(0), addr)
-                RomInfo.romBank(0).addSectionStart(addr, name)
-                CodeBlock(RomInfo.romBank(0), addr).addLabel(addr, name)
+        with Profiler.phase("entry points"):
+            ROMHeader(RomInfo.romBank(0))
+            if RomInfo.romBank(0)[0x0100] is None:
+                NoExport00(RomInfo.romBank(0), 0x100)
+                RomInfo.romBank(0).addSectionStart(0x100, "entry")
+                CodeBlock(RomInfo.romBank(0), 0x0100).addLabel(0x0100, "entry")
+                RomInfo.romBank(0).addSectionStart(0x150, "bank00_0150")
+
+            for addr, name in [(0x0040, "isrVBlank"), (0x0048, "isrLCDC"), (0x0050, "isrTimer"), (0x0058, "isrSerial"), (0x0060, "isrJoypad")]:
+                if RomInfo.memoryAt(addr).byte(addr) not in (0x00, 0xff) and RomInfo.memoryAt(addr)[addr] == None:
+                    NoExport00(RomInfo.romBank(0), addr)
+                    RomInfo.romBank(0).addSectionStart(addr, name)
+                    CodeBlock(RomInfo.romBank(0), addr).addLabel(addr, name)
 
         # Finally, for any data that has no blocks on it, see if we have marks from instrumentation that can decode it
-        for bank in RomInfo.getRomBanks():
-            for addr in range(bank.base_address, bank.base_address + len(bank)):
-                if not bank[addr]:
-                    if bank.hasMark(addr, "CODE"):
-                        CodeBlock(bank, addr)
-                    elif bank.hasMark(addr, "GFX_LOW") and bank.hasMark(addr + 1, "GFX_HIGH") and not bank[addr+1]:
-                        size = 2
-                        while size < 16 and bank.hasMark(addr + size, "GFX_LOW") and bank.hasMark(addr + size + 1, "GFX_HIGH") and not bank[addr + size] and not bank[addr + size + 1]:
-                            size += 2
-                        GfxBlock(bank, addr, bpp=2, size=size//2)
-                    elif bank.hasMark(addr, "GFX_HIGH"):
-                        size = 1
-                        while size < 8 and bank.hasMark(addr + size, "GFX_HIGH"):
-                            size += 1
-                        GfxBlock(bank, addr, bpp=1, size=size)
-                    elif bank.hasMark(addr, "PTR_LOW") and bank.hasMark(addr + 1, "PTR_HIGH"):
-                        DataBlock(bank, addr, format="p", amount=1)
-                    elif bank.hasMark(addr, "WORD_LOW") and bank.hasMark(addr + 1, "WORD_HIGH"):
-                        DataBlock(bank, addr, format="w", amount=1)
-            NoExport00(bank, bank.base_address + len(bank))
+        # Banks that do not exist yet have no marks and nothing traced into them, those are handled by the export.
+        with Profiler.phase("classify"):
+            if jobs > 1:
+                closed = traceBanksParallel(jobs, self.__classifyBank)
+            else:
+                closed = set()
+                for bank in RomInfo.existingRomBanks():
+                    with Profiler.item("classify bank", "%02x" % (bank.bankNumber)):
+                        self.__classifyBank(bank)
+                        NoExport00(bank, bank.base_address + len(bank))
+                    closed.add(bank.bankNumber)
+            # Banks that were created by tracing a bank after them.
+            for bank in RomInfo.existingRomBanks():
+                if bank.bankNumber not in closed:
+                    NoExport00(bank, bank.base_address + len(bank))
 
-    def export(self, path):
-        for bank in RomInfo.getRomBanks():
-            AutoLabelLocalizer(bank)
+        CodeBlock.statistics.report()
+
+    def __classifyBank(self, bank):
+        if not bank.hasAnyMark():
+            return
+        # Only addresses where one of the cases below can start a block are visited, still in address order,
+        # as blocks created at earlier addresses claim later ones.
+        for addr in self.__classifyCandidates(bank):
+            if not bank[addr]:
+                if bank.hasMark(addr, "CODE"):
+                    CodeBlock(bank, addr)
+                elif bank.hasMark(addr, "GFX_LOW") and bank.hasMark(addr + 1, "GFX_HIGH") and not bank[addr+1]:
+                    size = 2
+                    while size < 16 and bank.hasMark(addr + size, "GFX_LOW") and bank.hasMark(addr + size + 1, "GFX_HIGH") and not bank[addr + size] and not bank[addr + size + 1]:
+                        size += 2
+                    GfxBlock(bank, addr, bpp=2, size=size//2)
+                elif bank.hasMark(addr, "GFX_HIGH"):
+                    size = 1
+                    while size < 8 and bank.hasMark(addr + size, "GFX_HIGH"):
+                        size += 1
+                    GfxBlock(bank, addr, bpp=1, size=size)
+                elif bank.hasMark(addr, "PTR_LOW") and bank.hasMark(addr + 1, "PTR_HIGH"):
+                    DataBlock(bank, addr, format="p", amount=1)
+                elif bank.hasMark(addr, "WORD_LOW") and bank.hasMark(addr + 1, "WORD_HIGH"):
+                    DataBlock(bank, addr, format="w", amount=1)
+
+    def __classifyCandidates(self, bank):
+        def followedBy(first, second):
+            result = numpy.zeros(len(first), dtype=numpy.bool_)
+            result[:-1] = first[:-1] & second[1:]
+            return result
+
+        gfx_high = bank.markArray("GFX_HIGH")
+        candidates = bank.markArray("CODE") | gfx_high
+        candidates |= followedBy(bank.markArray("GFX_LOW"), gfx_high)
+        candidates |= followedBy(bank.markArray("PTR_LOW"), bank.markArray("PTR_HIGH"))
+        candidates |= followedBy(bank.markArray("WORD_LOW"), bank.markArray("WORD_HIGH"))
+        return (numpy.flatnonzero(candidates) + bank.base_address).tolist()
+
+    # xrefs: None, or "comments" to add the cross references below labels, "file" to write them to xrefs.txt, or "both".
+    def export(self, path, *, xrefs=None, jobs=1, split_size=None):
+        xref_comments = xrefs in ("comments", "both")
+        write_statistics.written = 0
+        write_statistics.unchanged = 0
+        with Profiler.phase("localize labels"):
+            for bank in RomInfo.existingRomBanks():
+                AutoLabelLocalizer(bank)
+            for memory in RomInfo.getAllMemories():
+                memory.buildLabelScopes()
+                memory.sortXrefs()
 
         if not os.path.exists(path):
             shutil.copytree(os.path.join(os.path.dirname(__file__), "template"), path)
-        open(os.path.join(path, "rom.gb.md5"), "wt").write("%s rom.gb\n" % (self.__rom.md5sum()))
+        writeFileIfChanged(os.path.join(path, "rom.gb.md5"), "%s rom.gb\n" % (self.__rom.md5sum()))
 
         objfiles = []
-        for bank in RomInfo.getRomBanks():
-            print("Exporting bank: %02x" % (bank.bankNumber))
-            file = AssemblyFile(path, bank.main_filename, bank)
-            file.startSection()
-            self.__exportRomBank(file, bank)
+        splits = {}
+        if split_size:
+            self.__updateMakefileForSplits(path)
+            for bank in RomInfo.existingRomBanks():
+                splits[bank.bankNumber] = self.__splitBank(bank, split_size)
+        with Profiler.phase("rom banks"):
+            export_bank = lambda bank_nr: self.__exportRomBankFile(path, bank_nr, xref_comments, splits.get(bank_nr, {}))
+            bank_nrs = list(range(RomInfo.romBankCount()))
+            if jobs > 1:
+                exportBanksParallel(bank_nrs, jobs, export_bank)
+            else:
+                for bank_nr in bank_nrs:
+                    print("Exporting bank: %02x" % (bank_nr))
+                    with Profiler.item("export bank", "%02x" % (bank_nr)):
+                        export_bank(bank_nr)
         
-        f = AssemblyFile(path, os.path.join("src", "memory.asm"))
-        self.__exportRam(f, RomInfo.getWRam())
-        self.__exportRam(f, RomInfo.getHRam())
-        self.__exportRam(f, RomInfo.getVRam())
-        self.__exportRam(f, RomInfo.getSRam())
-        for wramBankNum in range(1, self.wram_banks):
-            wramBankFile = AssemblyFile(path, os.path.join("src", "memory%01X.asm" % wramBankNum))
-            self.__exportRam(wramBankFile, RomInfo.getWRam(wramBankNum))
-
-        os.makedirs(os.path.join(path, "src", "include"), exist_ok=True)
-        macro_file = open(os.path.join(path, "src", "include", "macros.inc"), "wt")
+        with Profiler.phase("ram"):
+            f = AssemblyFile(path, os.path.join("src", "memory.asm"), xref_comments=xref_comments, atomic=True)
+            self.__exportRam(f, RomInfo.getWRam())
+            self.__exportRam(f, RomInfo.getHRam())
+            self.__exportRam(f, RomInfo.getVRam())
+            self.__exportRam(f, RomInfo.getSRam())
+            f.close()
+            for wramBankNum in range(1, self.wram_banks):
+                wramBankFile = AssemblyFile(path, os.path.join("src", "memory%01X.asm" % wramBankNum), xref_comments=xref_comments, atomic=True)
+                self.__exportRam(wramBankFile, RomInfo.getWRam(wramBankNum))
+                wramBankFile.close()
+
+        macro_file = []
         for macro, contents in sorted(RomInfo.macros.items()):
-            macro_file.write("MACRO %s\n" % (macro))
+            macro_file.append("MACRO %s\n" % (macro))
             for line in contents.rstrip().split("\n"):
-                macro_file.write("%s\n" % (line.rstrip()))
-            macro_file.write("ENDM\n")
+                macro_file.append("%s\n" % (line.rstrip()))
+            macro_file.append("ENDM\n")
+        writeFileIfChanged(os.path.join(path, "src", "include", "macros.inc"), "".join(macro_file))
 
-        charmap_file = open(os.path.join(path, "src", "include", "charmaps.inc"), "wt")
+        charmap_file = []
         for name, data in sorted(RomInfo.charmap.items()):
-            charmap_file.write("PUSHC\n")
-            charmap_file.write("NEWCHARMAP %s\n" % (name))
+            charmap_file.append("PUSHC\n")
+            charmap_file.append("NEWCHARMAP %s\n" % (name))
             for key, value in sorted(data.items()):
-                charmap_file.write("CHARMAP \"%s\", %d\n" % (value, key))
-            charmap_file.write("POPC\n")
+                charmap_file.append("CHARMAP \"%s\", %d\n" % (value, key))
+            charmap_file.append("POPC\n")
+        writeFileIfChanged(os.path.join(path, "src", "include", "charmaps.inc"), "".join(charmap_file))
 
-        constants_file = open(os.path.join(path, "src", "include", "constants.inc"), "wt")
+        constants_file = []
         for name, group in RomInfo.constants.items():
-            constants_file.write(";;Constants: %s\n" % (name))
+            constants_file.append(";;Constants: %s\n" % (name))
             for name, value in group.items():
-                constants_file.write("DEF %s = $%02x\n" % (name, value))
+                constants_file.append("DEF %s = $%02x\n" % (name, value))
+        writeFileIfChanged(os.path.join(path, "src", "include", "constants.inc"), "".join(constants_file))
 
-    def __exportRomBank(self, file, bank):
+        if xrefs in ("file", "both"):
+            self.__exportXrefs(os.path.join(path, "xrefs.txt"))
+        self.__removeOldSplits(path, splits)
+        write_statistics.report()
+
+    # One line per cross reference: target, label of the target, kind of reference and where it is referenced from.
+    def __exportXrefs(self, filename):
+        f = []
+        for memory in RomInfo.getAllMemories():
+            for addr, refs in sorted(memory.getAllXrefs(), key=lambda item: item[0]):
+                if isinstance(memory, (RomMemory, WRamMemoryBanked)):
+                    target = "%02x:%04x" % (memory.bankNumber, addr)
+                else:
+                    target = "%04x" % (addr)
+                label = memory.getLabel(addr)
+                label = str(label) if label else "-"
+                for source_bank, source_addr, kind in refs:
+                    f.append("%s %s <- %s %02x:%04x\n" % (target, label, kind, source_bank, source_addr))
+        writeFileIfChanged(filename, "".join(f))
+
+    # Split a bank into parts of at most split_size bytes, at global labels that start a block or are outside of blocks.
+    # Parts can be bigger when there is no such label within split_size bytes. Parts never start inside an include,
+    # or where an include ends, as the end of an include is read back from the first line after it in the same file.
+    # Returns the filename of the part that starts at each split address.
+    def __splitBank(self, bank, split_size):
+        bank_end = bank.base_address + len(bank)
+        include_depth = numpy.zeros(len(bank) + 1, dtype=numpy.int32)
+        for addr, filenames in bank.getAllIncludeStarts():
+            include_depth[addr - bank.base_address + 1] += len(filenames)
+        for addr, amount in bank.getAllIncludeEnds():
+            include_depth[addr - bank.base_address] -= amount
+        include_depth = numpy.cumsum(include_depth)
+
+        candidates = []
+        for addr, label in bank.getAllLabels():
+            if not label or addr == bank.base_address or include_depth[addr - bank.base_address] != 0 or bank.getIncludeEnd(addr) or "." in str(label):
+                continue
+            block = bank[addr]
+            if block is None or block.base_address == addr:
+                candidates.append(addr)
+        candidates.sort()
+
+        splits = {}
+        start = bank.base_address
+        previous = None
+        for addr in candidates + [bank_end]:
+            if addr - start > split_size and previous is not None and previous > start:
+                splits[previous] = os.path.join("split", "bank%02X_%04X.asm" % (bank.bankNumber, previous))
+                start = previous
+            previous = addr
+        return splits
+
+    # The template is only copied for new projects, so the Makefile of an existing project can miss src/split, and the
+    # parts would not be assembled. The SRCS line of the old template is updated, other Makefiles have to be changed by hand.
+    def __updateMakefileForSplits(self, path):
+        filename = os.path.join(path, "Makefile")
+        with open(filename, "rt", newline="") as f:
+            makefile = f.read()
+        if "src/split/*.asm" in makefile:
+            return
+        old_srcs = "SRCS = $(wildcard src/*.asm)"
+        if old_srcs not in makefile:
+            raise RuntimeError("%s does not assemble src/split/*.asm, add it to SRCS to use --split-size" % (filename))
+        print("Adding src/split/*.asm to SRCS in %s" % (filename))
+        with open(filename, "wt", newline="") as f:
+            f.write(makefile.replace(old_srcs, "SRCS = $(wildcard src/*.asm src/split/*.asm)", 1))
+
+    # Parts of banks in src/split that are not part of this export are removed, as the Makefile assembles every file in there.
+    def __removeOldSplits(self, path, splits):
+        split_path = os.path.join(path, "src", "split")
+        if not os.path.exists(split_path):
+            return
+        filenames = set(os.path.basename(filename) for bank_splits in splits.values() for filename in bank_splits.values())
+        for filename in os.listdir(split_path):
+            if filename.endswith(".asm") and filename not in filenames:
+                print("Removing old split file: %s" % (filename))
+                os.unlink(os.path.join(split_path, filename))
+
+    # Banks that still do not exist were not touched by the analysis. Those are only created here, unless they are
+    # $00 or $FF padding, which is written straight from the rom data.
+    def __exportRomBankFile(self, path, bank_nr, xref_comments, splits):
+        if not RomInfo.hasRomBank(bank_nr):
+            fill = self.__rom.bankFillByte(bank_nr)
+            if fill is not None:
+                self.__exportPaddingBank(path, bank_nr, fill)
+                return
+            bank = RomInfo.romBank(bank_nr)
+            NoExport00(bank, bank.base_address + len(bank))
+        bank = RomInfo.romBank(bank_nr)
+        file = AssemblyFile(path, bank.main_filename, bank, xref_comments=xref_comments, atomic=True)
+        file.startSection()
+        self.__exportRomBank(file, bank, splits)
+        file.close()
+
+    # Same output as exporting a bare bank of padding, where NoExport00 leaves only the first byte of a $00 bank.
+    def __exportPaddingBank(self, path, bank_nr, fill):
+        file = AssemblyFile(path, "src/bank%02X.asm" % (bank_nr), atomic=True)
+        file.startPaddingBankSection(bank_nr)
+        size = 1 if fill == 0x00 else 0x4000
+        file.dataLines(size, data=bytes([fill]) * size)
+        file.close()
+
+    def __exportRomBank(self, main_file, bank, splits):
         bank_len = len(bank)
         bank_end = bank.base_address + bank_len
+        # Banks without labels, comments or marks, like unused padding banks, have their data written in one go.
+        bare = bank.isBare()
+        file = main_file
         file_stack = []
         while file.addr < bank_end:
             for n in range(bank.getIncludeEnd(file.addr)):
                 file_stack[-1].addr = file.addr
+                file.close()
                 file = file_stack.pop()
+            split = splits.get(file.addr)
+            if split is not None:
+                # Every part is a separate file with its own section, so it is assembled on its own.
+                assert not file_stack
+                if file is not main_file:
+                    file.close()
+                addr = file.addr
+                file = AssemblyFile(file.basepath, os.path.join("src", split), bank, xref_comments=file.xref_comments, atomic=file.atomic)
+                file.startSection(addr=addr)
             inc_start = bank.getIncludeStart(file.addr)
             if inc_start:
                 for inc in inc_start:
                     file.include(inc)
                     file_stack.append(file)
-                    file = AssemblyFile(file.basepath, os.path.join("src", inc), bank, addr=file.addr)
+                    file = AssemblyFile(file.basepath, os.path.join("src", inc), bank, addr=file.addr, xref_comments=file.xref_comments, atomic=file.atomic)
             if bank[file.addr]:
                 addr = file.addr
                 bank[file.addr].export(file)
                 assert addr + len(bank[addr]) == file.addr, "Block export of type %s failed to export proper size (%d != %d)" % (bank[addr].__class__.__name__, file.addr - addr, len(bank[addr]))
+            elif bare:
+                next_block = bank.nextClaimedAddress(file.addr)
+                file.dataLines((bank_end if next_block is None else next_block) - file.addr)
             else:
+                end = min(file.addr + 8, bank_end)
+                next_block = bank.nextClaimedAddress(file.addr)
+                if next_block is not None:
+                    end = min(end, next_block)
                 size = 1
-                while size < 8 and file.addr + size < bank_end and not bank[file.addr + size] and not bank.getLabel(file.addr + size):
+                while file.addr + size < end and not bank.getLabel(file.addr + size):
                     size += 1
                 file.dataLine(size)
+        # Includes that are not ended before the end of the bank.
+        while file_stack:
+            file.close()
+            file = file_stack.pop()
+        if file is not main_file:
+            file.close()
 
     def __exportRam(self, file, memory):
         file.startSection(memory=memory)
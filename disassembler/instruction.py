@@ -77,385 +77,249 @@ class InstructionDecodeError(Exception):
     pass
 
 
+# Placeholder in the opcode table for an immediate operand that follows the opcode byte.
+class _Operand:
+    def __init__(self, size, decode):
+        self.size = size
+        self.decode = decode
+
+
+def _int8(value):
+    if value >= 0x80:
+        value -= 0x100
+    return value
+
+
+_U8 = _Operand(1, lambda bank, address: bank.byte(address + 1))
+_I8 = _Operand(1, lambda bank, address: _int8(bank.byte(address + 1)))
+_REL = _Operand(1, lambda bank, address: address + 2 + _int8(bank.byte(address + 1)))
+_U16 = _Operand(2, lambda bank, address: bank.word(address + 1))
+_REF_U16 = _Operand(2, lambda bank, address: Ref(bank.word(address + 1)))
+_REF_HIGH = _Operand(1, lambda bank, address: Ref(0xFF00 | bank.byte(address + 1)))
+_SP_OFFSET = _Operand(1, lambda bank, address: "SP%+d" % (_int8(bank.byte(address + 1))))
+
+_REF_BC = Ref(BC)
+_REF_DE = Ref(DE)
+_REF_HL = Ref(HL)
+_REF_HLI = Ref("HL+")
+_REF_HLD = Ref("HL-")
+_REF_C = Ref(C)
+
+# Operands as encoded in the lower 3 bits of the $40-$BF and CB prefixed opcodes.
+_R8 = (B, C, D, E, H, L, _REF_HL, A)
+
+# Opcode byte -> (type, p0, p1, condition). Opcodes $10 (stop) and $CB (prefix) are decoded separately.
+_OPCODES = {
+    0x00: (NOP,),
+    0x20: (JR, _REL, None, COND_NZ),
+    0x30: (JR, _REL, None, COND_NC),
+
+    0x01: (LD, BC, _U16),
+    0x11: (LD, DE, _U16),
+    0x21: (LD, HL, _U16),
+    0x31: (LD, SP, _U16),
+
+    0x02: (LD, _REF_BC, A),
+    0x12: (LD, _REF_DE, A),
+    0x22: (LD, _REF_HLI, A),
+    0x32: (LD, _REF_HLD, A),
+
+    0x03: (INC, BC),
+    0x13: (INC, DE),
+    0x23: (INC, HL),
+    0x33: (INC, SP),
+
+    0x04: (INC, B),
+    0x14: (INC, D),
+    0x24: (INC, H),
+    0x34: (INC, _REF_HL),
+
+    0x05: (DEC, B),
+    0x15: (DEC, D),
+    0x25: (DEC, H),
+    0x35: (DEC, _REF_HL),
+
+    0x06: (LD, B, _U8),
+    0x16: (LD, D, _U8),
+    0x26: (LD, H, _U8),
+    0x36: (LD, _REF_HL, _U8),
+
+    0x07: (RLCA,),
+    0x17: (RLA,),
+    0x27: (DAA,),
+    0x37: (SCF,),
+
+    0x08: (LD, _REF_U16, SP),
+    0x18: (JR, _REL),
+    0x28: (JR, _REL, None, COND_Z),
+    0x38: (JR, _REL, None, COND_C),
+
+    0x09: (ADD, HL, BC),
+    0x19: (ADD, HL, DE),
+    0x29: (ADD, HL, HL),
+    0x39: (ADD, HL, SP),
+
+    0x0A: (LD, A, _REF_BC),
+    0x1A: (LD, A, _REF_DE),
+    0x2A: (LD, A, _REF_HLI),
+    0x3A: (LD, A, _REF_HLD),
+
+    0x0B: (DEC, BC),
+    0x1B: (DEC, DE),
+    0x2B: (DEC, HL),
+    0x3B: (DEC, SP),
+
+    0x0C: (INC, C),
+    0x1C: (INC, E),
+    0x2C: (INC, L),
+    0x3C: (INC, A),
+
+    0x0D: (DEC, C),
+    0x1D: (DEC, E),
+    0x2D: (DEC, L),
+    0x3D: (DEC, A),
+
+    0x0E: (LD, C, _U8),
+    0x1E: (LD, E, _U8),
+    0x2E: (LD, L, _U8),
+    0x3E: (LD, A, _U8),
+
+    0x0F: (RRCA,),
+    0x1F: (RRA,),
+    0x2F: (CPL,),
+    0x3F: (CCF,),
+
+    0xC0: (RET, None, None, COND_NZ),
+    0xD0: (RET, None, None, COND_NC),
+    0xE0: (LDH, _REF_HIGH, A),
+    0xF0: (LDH, A, _REF_HIGH),
+
+    0xC1: (POP, BC),
+    0xD1: (POP, DE),
+    0xE1: (POP, HL),
+    0xF1: (POP, AF),
+
+    0xC2: (JP, _U16, None, COND_NZ),
+    0xD2: (JP, _U16, None, COND_NC),
+    0xE2: (LDH, _REF_C, A),
+    0xF2: (LDH, A, _REF_C),
+
+    0xC3: (JP, _U16),
+    0xF3: (DI,),
+
+    0xC4: (CALL, _U16, None, COND_NZ),
+    0xD4: (CALL, _U16, None, COND_NC),
+
+    0xC5: (PUSH, BC),
+    0xD5: (PUSH, DE),
+    0xE5: (PUSH, HL),
+    0xF5: (PUSH, AF),
+
+    0xC6: (ADD, A, _U8),
+    0xD6: (SUB, A, _U8),
+    0xE6: (AND, A, _U8),
+    0xF6: (OR, A, _U8),
+
+    0xC7: (RST, 0x0000),
+    0xD7: (RST, 0x0010),
+    0xE7: (RST, 0x0020),
+    0xF7: (RST, 0x0030),
+
+    0xC8: (RET, None, None, COND_Z),
+    0xD8: (RET, None, None, COND_C),
+    0xE8: (ADD, SP, _I8),
+    0xF8: (LD, HL, _SP_OFFSET),
+
+    0xC9: (RET,),
+    0xD9: (RETI,),
+    0xE9: (JP, HL),
+    0xF9: (LD, SP, HL),
+
+    0xCA: (JP, _U16, None, COND_Z),
+    0xDA: (JP, _U16, None, COND_C),
+    0xEA: (LD, _REF_U16, A),
+    0xFA: (LD, A, _REF_U16),
+
+    0xFB: (EI,),
+
+    0xCC: (CALL, _U16, None, COND_Z),
+    0xDC: (CALL, _U16, None, COND_C),
+
+    0xCD: (CALL, _U16),
+
+    0xCE: (ADC, A, _U8),
+    0xDE: (SBC, A, _U8),
+    0xEE: (XOR, A, _U8),
+    0xFE: (CP, A, _U8),
+
+    0xCF: (RST, 0x0008),
+    0xDF: (RST, 0x0018),
+    0xEF: (RST, 0x0028),
+    0xFF: (RST, 0x0038),
+}
+for op in range(0x40, 0x80):
+    _OPCODES[op] = (LD, _R8[(op >> 3) & 0x07], _R8[op & 0x07])
+_OPCODES[0x76] = (HALT,)
+for op in range(0x80, 0xC0):
+    _OPCODES[op] = ((ADD, ADC, SUB, SBC, AND, XOR, OR, CP)[(op >> 3) & 0x07], A, _R8[op & 0x07])
+
+
+def _buildOpcodeTable():
+    table = [None] * 256
+    for op, (instr_type, p0, p1, condition) in ((op, entry + (None,) * (4 - len(entry))) for op, entry in _OPCODES.items()):
+        operand = p0 if isinstance(p0, _Operand) else p1 if isinstance(p1, _Operand) else None
+        size = 1 + (operand.size if operand is not None else 0)
+        table[op] = (instr_type, condition, p0, p1, size, operand)
+    return table
+
+
+def _buildCBTable():
+    table = []
+    for op in range(256):
+        if op < 0x40:
+            table.append(((RLC, RRC, RL, RR, SLA, SRA, SWAP, SRL)[op >> 3], _R8[op & 0x07], None))
+        else:
+            table.append(((None, BIT, RES, SET)[op >> 6], (op >> 3) & 0x07, _R8[op & 0x07]))
+    return table
+
+
+# Fully precomputed decode tables, indexed by the opcode byte. None marks an invalid opcode.
+OPCODE_TABLE = _buildOpcodeTable()
+CB_TABLE = _buildCBTable()
+
+
 class Instruction:
+    __slots__ = ("bank", "address", "type", "condition", "p0", "p1", "size")
+
     def __init__(self, bank, address):
         self.bank = bank
         self.address = address
-        self.type = None
-        self.condition = None
-        self.p0 = None
-        self.p1 = None
-        self.size = 1
 
         op = bank.byte(address)
-
-        if op == 0x00: self.__set(NOP)
-        if op == 0x10:
-            if self.__getUInt8() == 0x00: # STOP has NOP after it according to the documentation, but not everyone does this.
-                self.__set(STOP)
+        if op == 0xCB:
+            self.type, self.p0, self.p1 = CB_TABLE[bank.byte(address + 1)]
+            self.condition = None
+            self.size = 2
+        elif op == 0x10:
+            self.condition = None
+            self.p0 = None
+            self.p1 = None
+            if bank.byte(address + 1) == 0x00: # STOP has NOP after it according to the documentation, but not everyone does this.
+                self.type = STOP
+                self.size = 2
             else:
+                self.type = SHORT_STOP
                 self.size = 1
-                self.__set(SHORT_STOP)
-        if op == 0x20: self.__set(JR, self.__getRelativeWord(), condition=COND_NZ)
-        if op == 0x30: self.__set(JR, self.__getRelativeWord(), condition=COND_NC)
-
-        if op == 0x01: self.__set(LD, BC, self.__getUInt16())
-        if op == 0x11: self.__set(LD, DE, self.__getUInt16())
-        if op == 0x21: self.__set(LD, HL, self.__getUInt16())
-        if op == 0x31: self.__set(LD, SP, self.__getUInt16())
-
-        if op == 0x02: self.__set(LD, Ref(BC), A)
-        if op == 0x12: self.__set(LD, Ref(DE), A)
-        if op == 0x22: self.__set(LD, Ref("HL+"), A)
-        if op == 0x32: self.__set(LD, Ref("HL-"), A)
-
-        if op == 0x03: self.__set(INC, BC)
-        if op == 0x13: self.__set(INC, DE)
-        if op == 0x23: self.__set(INC, HL)
-        if op == 0x33: self.__set(INC, SP)
-
-        if op == 0x04: self.__set(INC, B)
-        if op == 0x14: self.__set(INC, D)
-        if op == 0x24: self.__set(INC, H)
-        if op == 0x34: self.__set(INC, Ref(HL))
-
-        if op == 0x05: self.__set(DEC, B)
-        if op == 0x15: self.__set(DEC, D)
-        if op == 0x25: self.__set(DEC, H)
-        if op == 0x35: self.__set(DEC, Ref(HL))
-
-        if op == 0x06: self.__set(LD, B, self.__getUInt8())
-        if op == 0x16: self.__set(LD, D, self.__getUInt8())
-        if op == 0x26: self.__set(LD, H, self.__getUInt8())
-        if op == 0x36: self.__set(LD, Ref(HL), self.__getUInt8())
-
-        if op == 0x07: self.__set(RLCA)
-        if op == 0x17: self.__set(RLA)
-        if op == 0x27: self.__set(DAA)
-        if op == 0x37: self.__set(SCF)
-
-        if op == 0x08: self.__set(LD, Ref(self.__getUInt16()), SP)
-        if op == 0x18: self.__set(JR, self.__getRelativeWord())
-        if op == 0x28: self.__set(JR, self.__getRelativeWord(), condition=COND_Z)
-        if op == 0x38: self.__set(JR, self.__getRelativeWord(), condition=COND_C)
-
-        if op == 0x09: self.__set(ADD, HL, BC)
-        if op == 0x19: self.__set(ADD, HL, DE)
-        if op == 0x29: self.__set(ADD, HL, HL)
-        if op == 0x39: self.__set(ADD, HL, SP)
-
-        if op == 0x0A: self.__set(LD, A, Ref(BC))
-        if op == 0x1A: self.__set(LD, A, Ref(DE))
-        if op == 0x2A: self.__set(LD, A, Ref("HL+"))
-        if op == 0x3A: self.__set(LD, A, Ref("HL-"))
-
-        if op == 0x0B: self.__set(DEC, BC)
-        if op == 0x1B: self.__set(DEC, DE)
-        if op == 0x2B: self.__set(DEC, HL)
-        if op == 0x3B: self.__set(DEC, SP)
-
-        if op == 0x0C: self.__set(INC, C)
-        if op == 0x1C: self.__set(INC, E)
-        if op == 0x2C: self.__set(INC, L)
-        if op == 0x3C: self.__set(INC, A)
-
-        if op == 0x0D: self.__set(DEC, C)
-        if op == 0x1D: self.__set(DEC, E)
-        if op == 0x2D: self.__set(DEC, L)
-        if op == 0x3D: self.__set(DEC, A)
-
-        if op == 0x0E: self.__set(LD, C, self.__getUInt8())
-        if op == 0x1E: self.__set(LD, E, self.__getUInt8())
-        if op == 0x2E: self.__set(LD, L, self.__getUInt8())
-        if op == 0x3E: self.__set(LD, A, self.__getUInt8())
-
-        if op == 0x0F: self.__set(RRCA)
-        if op == 0x1F: self.__set(RRA)
-        if op == 0x2F: self.__set(CPL)
-        if op == 0x3F: self.__set(CCF)
-
-        if op == 0x40: self.__set(LD, B, B)
-        if op == 0x50: self.__set(LD, D, B)
-        if op == 0x60: self.__set(LD, H, B)
-        if op == 0x70: self.__set(LD, Ref(HL), B)
-
-        if op == 0x41: self.__set(LD, B, C)
-        if op == 0x51: self.__set(LD, D, C)
-        if op == 0x61: self.__set(LD, H, C)
-        if op == 0x71: self.__set(LD, Ref(HL), C)
-
-        if op == 0x42: self.__set(LD, B, D)
-        if op == 0x52: self.__set(LD, D, D)
-        if op == 0x62: self.__set(LD, H, D)
-        if op == 0x72: self.__set(LD, Ref(HL), D)
-
-        if op == 0x43: self.__set(LD, B, E)
-        if op == 0x53: self.__set(LD, D, E)
-        if op == 0x63: self.__set(LD, H, E)
-        if op == 0x73: self.__set(LD, Ref(HL), E)
-
-        if op == 0x44: self.__set(LD, B, H)
-        if op == 0x54: self.__set(LD, D, H)
-        if op == 0x64: self.__set(LD, H, H)
-        if op == 0x74: self.__set(LD, Ref(HL), H)
-
-        if op == 0x45: self.__set(LD, B, L)
-        if op == 0x55: self.__set(LD, D, L)
-        if op == 0x65: self.__set(LD, H, L)
-        if op == 0x75: self.__set(LD, Ref(HL), L)
-
-        if op == 0x46: self.__set(LD, B, Ref(HL))
-        if op == 0x56: self.__set(LD, D, Ref(HL))
-        if op == 0x66: self.__set(LD, H, Ref(HL))
-        if op == 0x76: self.__set(HALT)
-        if op == 0x47: self.__set(LD, B, A)
-        if op == 0x57: self.__set(LD, D, A)
-        if op == 0x67: self.__set(LD, H, A)
-        if op == 0x77: self.__set(LD, Ref(HL), A)
-
-        if op == 0x48: self.__set(LD, C, B)
-        if op == 0x58: self.__set(LD, E, B)
-        if op == 0x68: self.__set(LD, L, B)
-        if op == 0x78: self.__set(LD, A, B)
-
-        if op == 0x49: self.__set(LD, C, C)
-        if op == 0x59: self.__set(LD, E, C)
-        if op == 0x69: self.__set(LD, L, C)
-        if op == 0x79: self.__set(LD, A, C)
-
-        if op == 0x4A: self.__set(LD, C, D)
-        if op == 0x5A: self.__set(LD, E, D)
-        if op == 0x6A: self.__set(LD, L, D)
-        if op == 0x7A: self.__set(LD, A, D)
-
-        if op == 0x4B: self.__set(LD, C, E)
-        if op == 0x5B: self.__set(LD, E, E)
-        if op == 0x6B: self.__set(LD, L, E)
-        if op == 0x7B: self.__set(LD, A, E)
-
-        if op == 0x4C: self.__set(LD, C, H)
-        if op == 0x5C: self.__set(LD, E, H)
-        if op == 0x6C: self.__set(LD, L, H)
-        if op == 0x7C: self.__set(LD, A, H)
-
-        if op == 0x4D: self.__set(LD, C, L)
-        if op == 0x5D: self.__set(LD, E, L)
-        if op == 0x6D: self.__set(LD, L, L)
-        if op == 0x7D: self.__set(LD, A, L)
-
-        if op == 0x4E: self.__set(LD, C, Ref(HL))
-        if op == 0x5E: self.__set(LD, E, Ref(HL))
-        if op == 0x6E: self.__set(LD, L, Ref(HL))
-        if op == 0x7E: self.__set(LD, A, Ref(HL))
-
-        if op == 0x4F: self.__set(LD, C, A)
-        if op == 0x5F: self.__set(LD, E, A)
-        if op == 0x6F: self.__set(LD, L, A)
-        if op == 0x7F: self.__set(LD, A, A)
-
-        if op == 0x80: self.__set(ADD, A, B)
-        if op == 0x81: self.__set(ADD, A, C)
-        if op == 0x82: self.__set(ADD, A, D)
-        if op == 0x83: self.__set(ADD, A, E)
-        if op == 0x84: self.__set(ADD, A, H)
-        if op == 0x85: self.__set(ADD, A, L)
-        if op == 0x86: self.__set(ADD, A, Ref(HL))
-        if op == 0x87: self.__set(ADD, A, A)
-
-        if op == 0x88: self.__set(ADC, A, B)
-        if op == 0x89: self.__set(ADC, A, C)
-        if op == 0x8A: self.__set(ADC, A, D)
-        if op == 0x8B: self.__set(ADC, A, E)
-        if op == 0x8C: self.__set(ADC, A, H)
-        if op == 0x8D: self.__set(ADC, A, L)
-        if op == 0x8E: self.__set(ADC, A, Ref(HL))
-        if op == 0x8F: self.__set(ADC, A, A)
-
-        if op == 0x90: self.__set(SUB, A, B)
-        if op == 0x91: self.__set(SUB, A, C)
-        if op == 0x92: self.__set(SUB, A, D)
-        if op == 0x93: self.__set(SUB, A, E)
-        if op == 0x94: self.__set(SUB, A, H)
-        if op == 0x95: self.__set(SUB, A, L)
-        if op == 0x96: self.__set(SUB, A, Ref(HL))
-        if op == 0x97: self.__set(SUB, A, A)
-
-        if op == 0x98: self.__set(SBC, A, B)
-        if op == 0x99: self.__set(SBC, A, C)
-        if op == 0x9A: self.__set(SBC, A, D)
-        if op == 0x9B: self.__set(SBC, A, E)
-        if op == 0x9C: self.__set(SBC, A, H)
-        if op == 0x9D: self.__set(SBC, A, L)
-        if op == 0x9E: self.__set(SBC, A, Ref(HL))
-        if op == 0x9F: self.__set(SBC, A, A)
-
-        if op == 0xA0: self.__set(AND, A, B)
-        if op == 0xA1: self.__set(AND, A, C)
-        if op == 0xA2: self.__set(AND, A, D)
-        if op == 0xA3: self.__set(AND, A, E)
-        if op == 0xA4: self.__set(AND, A, H)
-        if op == 0xA5: self.__set(AND, A, L)
-        if op == 0xA6: self.__set(AND, A, Ref(HL))
-        if op == 0xA7: self.__set(AND, A, A)
-
-        if op == 0xA8: self.__set(XOR, A, B)
-        if op == 0xA9: self.__set(XOR, A, C)
-        if op == 0xAA: self.__set(XOR, A, D)
-        if op == 0xAB: self.__set(XOR, A, E)
-        if op == 0xAC: self.__set(XOR, A, H)
-        if op == 0xAD: self.__set(XOR, A, L)
-        if op == 0xAE: self.__set(XOR, A, Ref(HL))
-        if op == 0xAF: self.__set(XOR, A, A)
-
-        if op == 0xB0: self.__set(OR, A, B)
-        if op == 0xB1: self.__set(OR, A, C)
-        if op == 0xB2: self.__set(OR, A, D)
-        if op == 0xB3: self.__set(OR, A, E)
-        if op == 0xB4: self.__set(OR, A, H)
-        if op == 0xB5: self.__set(OR, A, L)
-        if op == 0xB6: self.__set(OR, A, Ref(HL))
-        if op == 0xB7: self.__set(OR, A, A)
-
-        if op == 0xB8: self.__set(CP, A, B)
-        if op == 0xB9: self.__set(CP, A, C)
-        if op == 0xBA: self.__set(CP, A, D)
-        if op == 0xBB: self.__set(CP, A, E)
-        if op == 0xBC: self.__set(CP, A, H)
-        if op == 0xBD: self.__set(CP, A, L)
-        if op == 0xBE: self.__set(CP, A, Ref(HL))
-        if op == 0xBF: self.__set(CP, A, A)
-
-        if op == 0xC0: self.__set(RET, condition=COND_NZ)
-        if op == 0xD0: self.__set(RET, condition=COND_NC)
-        if op == 0xE0: self.__set(LDH, Ref(0xFF00 | self.__getUInt8()), A)
-        if op == 0xF0: self.__set(LDH, A, Ref(0xFF00 | self.__getUInt8()))
-
-        if op == 0xC1: self.__set(POP, BC)
-        if op == 0xD1: self.__set(POP, DE)
-        if op == 0xE1: self.__set(POP, HL)
-        if op == 0xF1: self.__set(POP, AF)
-
-        if op == 0xC2: self.__set(JP, self.__getUInt16(), condition=COND_NZ)
-        if op == 0xD2: self.__set(JP, self.__getUInt16(), condition=COND_NC)
-        if op == 0xE2: self.__set(LDH, Ref(C), A)
-        if op == 0xF2: self.__set(LDH, A, Ref(C))
-
-        if op == 0xC3: self.__set(JP, self.__getUInt16())
-        # if op == 0xD3: self.__set("ERROR", 0xD3)
-        # if op == 0xE3: self.__set("ERROR", 0xE3)
-        if op == 0xF3: self.__set(DI)
-
-        if op == 0xC4: self.__set(CALL, self.__getUInt16(), condition=COND_NZ)
-        if op == 0xD4: self.__set(CALL, self.__getUInt16(), condition=COND_NC)
-        # if op == 0xE4: self.__set("ERROR", 0xE4)
-        # if op == 0xF4: self.__set("ERROR", 0xF4)
-
-        if op == 0xC5: self.__set(PUSH, BC)
-        if op == 0xD5: self.__set(PUSH, DE)
-        if op == 0xE5: self.__set(PUSH, HL)
-        if op == 0xF5: self.__set(PUSH, AF)
-
-        if op == 0xC6: self.__set(ADD, A, self.__getUInt8())
-        if op == 0xD6: self.__set(SUB, A, self.__getUInt8())
-        if op == 0xE6: self.__set(AND, A, self.__getUInt8())
-        if op == 0xF6: self.__set(OR, A, self.__getUInt8())
-
-        if op == 0xC7: self.__set(RST, 0x0000)
-        if op == 0xD7: self.__set(RST, 0x0010)
-        if op == 0xE7: self.__set(RST, 0x0020)
-        if op == 0xF7: self.__set(RST, 0x0030)
-
-        if op == 0xC8: self.__set(RET, condition=COND_Z)
-        if op == 0xD8: self.__set(RET, condition=COND_C)
-        if op == 0xE8: self.__set(ADD, SP, self.__getInt8())
-        if op == 0xF8: self.__set(LD, HL, "SP%+d" % (self.__getInt8()))
-
-        if op == 0xC9: self.__set(RET)
-        if op == 0xD9: self.__set(RETI)
-        if op == 0xE9: self.__set(JP, HL)
-        if op == 0xF9: self.__set(LD, SP, HL)
-
-        if op == 0xCA: self.__set(JP, self.__getUInt16(), condition=COND_Z)
-        if op == 0xDA: self.__set(JP, self.__getUInt16(), condition=COND_C)
-        if op == 0xEA: self.__set(LD, Ref(self.__getUInt16()), A)
-        if op == 0xFA: self.__set(LD, A, Ref(self.__getUInt16()))
-
-        if op == 0xCB: self.__decodeCB(self.__getUInt8())
-        # if op == 0xDB: self.__set("ERROR", 0xDB)
-        # if op == 0xEB: self.__set("ERROR", 0xEB)
-        if op == 0xFB: self.__set(EI)
-
-        if op == 0xCC: self.__set(CALL, self.__getUInt16(), condition=COND_Z)
-        if op == 0xDC: self.__set(CALL, self.__getUInt16(), condition=COND_C)
-        # if op == 0xEC: self.__set("ERROR", 0xEC)
-        # if op == 0xFC: self.__set("ERROR", 0xFC)
-
-        if op == 0xCD: self.__set(CALL, self.__getUInt16())
-        # if op == 0xDD: self.__set("ERROR", 0xDD)
-        # if op == 0xED: self.__set("ERROR", 0xED)
-        # if op == 0xFD: self.__set("ERROR", 0xFD)
-
-        if op == 0xCE: self.__set(ADC, A, self.__getUInt8())
-        if op == 0xDE: self.__set(SBC, A, self.__getUInt8())
-        if op == 0xEE: self.__set(XOR, A, self.__getUInt8())
-        if op == 0xFE: self.__set(CP, A, self.__getUInt8())
-
-        if op == 0xCF: self.__set(RST, 0x0008)
-        if op == 0xDF: self.__set(RST, 0x0018)
-        if op == 0xEF: self.__set(RST, 0x0028)
-        if op == 0xFF: self.__set(RST, 0x0038)
-
-        if self.type is None:
-            raise InstructionDecodeError("Decode failed for: %02x:%04x:%02x" % (address >> 14, address, op))
-
-    def __decodeCB(self, op):
-        if (op & 0x07) == 0: self.p0 = B
-        if (op & 0x07) == 1: self.p0 = C
-        if (op & 0x07) == 2: self.p0 = D
-        if (op & 0x07) == 3: self.p0 = E
-        if (op & 0x07) == 4: self.p0 = H
-        if (op & 0x07) == 5: self.p0 = L
-        if (op & 0x07) == 6: self.p0 = Ref(HL)
-        if (op & 0x07) == 7: self.p0 = A
-        if op < 0x40:
-            if (op & 0xF8) == 0x00: self.type = RLC
-            if (op & 0xF8) == 0x08: self.type = RRC
-            if (op & 0xF8) == 0x10: self.type = RL
-            if (op & 0xF8) == 0x18: self.type = RR
-            if (op & 0xF8) == 0x20: self.type = SLA
-            if (op & 0xF8) == 0x28: self.type = SRA
-            if (op & 0xF8) == 0x30: self.type = SWAP
-            if (op & 0xF8) == 0x38: self.type = SRL
         else:
-            self.p1 = self.p0
-            self.p0 = (op >> 3) & 0x07
-            if (op & 0xC0) == 0x40: self.type = BIT
-            if (op & 0xC0) == 0x80: self.type = RES
-            if (op & 0xC0) == 0xC0: self.type = SET
-
-    def __set(self, instr_type, p0=None, p1=None, *, condition=None):
-        self.type = instr_type
-        self.condition = condition
-        self.p0 = p0
-        self.p1 = p1
-
-    def __getInt8(self):
-        value = self.__getUInt8()
-        if value >= 0x80:
-            value -= 0x100
-        return value
-
-    def __getRelativeWord(self):
-        address = self.address+2+self.__getInt8()
-        return address
-
-    def __getUInt8(self):
-        self.size += 1
-        return self.bank.byte(self.address+self.size-1)
-
-    def __getUInt16(self):
-        self.size += 2
-        return self.bank.word(self.address+self.size-2)
+            entry = OPCODE_TABLE[op]
+            if entry is None:
+                raise InstructionDecodeError("Decode failed for: %02x:%04x:%02x" % (address >> 14, address, op))
+            self.type, self.condition, self.p0, self.p1, self.size, operand = entry
+            if operand is not None:
+                if self.p0 is operand:
+                    self.p0 = operand.decode(bank, address)
+                else:
+                    self.p1 = operand.decode(bank, address)
 
     def hasNext(self):
         if self.type in (JP, JR, RET) and self.condition is None:
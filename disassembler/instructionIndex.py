@@ -0,0 +1,142 @@
+import numpy
+
+from instruction import *
+
+
+# Control flow classes of the instruction starting at an address.
+FLOW_NEXT = 0     # Continues with the next instruction.
+FLOW_JUMP = 1     # jp/jr, conditional or not.
+FLOW_CALL = 2     # call/rst, conditional or not.
+FLOW_RET = 3      # ret/reti, conditional or not.
+FLOW_INVALID = 4  # Not a valid opcode.
+
+NO_TARGET = -1
+
+_TARGET_NONE = 0
+_TARGET_U16 = 1
+_TARGET_REL = 2
+_TARGET_FIXED = 3
+
+
+# Memory that only has an opcode at address 0, with zero operands after it.
+class _OpcodeProbe:
+    def __init__(self, op):
+        self.__op = op
+
+    def byte(self, address):
+        return self.__op if address == 0 else 0x00
+
+    def word(self, address):
+        return self.byte(address) | (self.byte(address + 1) << 8)
+
+
+# True when the code tracing of CodeBlock only needs the size and code flow of the instruction: it has no jump target,
+# no address in its operands and does not load a register pair with a value. This does not depend on the operand values.
+def _isPlain(op):
+    instr = Instruction(_OpcodeProbe(op), 0)
+    if instr.jumpTarget() is not None:
+        return False
+    for p in (instr.p0, instr.p1):
+        if isinstance(p, Ref) and isinstance(p.target, int):
+            return False
+    if instr.p0 in (BC, DE, HL) and isinstance(instr.p1, int):
+        return False
+    return True
+
+
+def _buildLookupTables():
+    size = numpy.zeros(256, dtype=numpy.uint8)
+    flow = numpy.full(256, FLOW_INVALID, dtype=numpy.uint8)
+    has_next = numpy.zeros(256, dtype=numpy.bool_)
+    target_kind = numpy.zeros(256, dtype=numpy.uint8)
+    fixed_target = numpy.zeros(256, dtype=numpy.int32)
+    plain = numpy.zeros(256, dtype=numpy.bool_)
+    for op, entry in enumerate(OPCODE_TABLE):
+        if op == 0xCB:
+            size[op], flow[op], has_next[op], plain[op] = 2, FLOW_NEXT, True, True
+            continue
+        if op == 0x10:
+            # Size depends on the next byte, fixed up after the table lookup.
+            size[op], flow[op], has_next[op] = 1, FLOW_NEXT, True
+            continue
+        if entry is None:
+            continue
+        instr_type, condition, p0, p1, size[op], operand = entry
+        plain[op] = _isPlain(op)
+        has_next[op] = not ((instr_type in (JP, JR, RET) and condition is None) or instr_type == RETI)
+        if instr_type in (JP, JR):
+            flow[op] = FLOW_JUMP
+        elif instr_type in (CALL, RST):
+            flow[op] = FLOW_CALL
+        elif instr_type in (RET, RETI):
+            flow[op] = FLOW_RET
+        else:
+            flow[op] = FLOW_NEXT
+        if instr_type == JR:
+            target_kind[op] = _TARGET_REL
+        elif instr_type in (JP, CALL) and operand is not None:
+            target_kind[op] = _TARGET_U16
+        elif instr_type == RST:
+            target_kind[op] = _TARGET_FIXED
+            fixed_target[op] = p0
+    return size, flow, has_next, target_kind, fixed_target, plain
+
+_SIZE, _FLOW, _HAS_NEXT, _TARGET_KIND, _FIXED_TARGET, _PLAIN = _buildLookupTables()
+
+
+# For every address in a rom bank, the instruction that would be decoded if code started at that address.
+# Built in a single vectorized pass over the raw bank data, so heuristics can query candidate
+# instructions without decoding them one by one with Instruction.
+#   size:     instruction size in bytes, 0 for invalid opcodes
+#   flow:     one of the FLOW_* classes
+#   has_next: same as Instruction.hasNext()
+#   target:   same as Instruction.jumpTarget(), NO_TARGET when there is none
+#   plain:    code tracing only needs the size and has_next of the instruction, see _isPlain
+class InstructionIndex:
+    def __init__(self, memory):
+        self.base_address = memory.base_address
+        length = len(memory)
+
+        # Operands of the last instructions can be read from past the end of the bank, like Instruction does.
+        data = numpy.zeros(length + 2, dtype=numpy.uint8)
+        raw = memory.bytesView(memory.base_address, length + 2)
+        data[:len(raw)] = numpy.frombuffer(raw, dtype=numpy.uint8)
+        op = data[:length]
+        b1 = data[1:length + 1].astype(numpy.int32)
+        b2 = data[2:length + 2].astype(numpy.int32)
+
+        self.size = _SIZE[op]
+        self.size[(op == 0x10) & (b1 == 0x00)] = 2
+        self.flow = _FLOW[op]
+        self.has_next = _HAS_NEXT[op]
+        self.plain = _PLAIN[op]
+        # Instructions that continue past the end of the rom fail to decode with Instruction.
+        self.plain[numpy.arange(length) + self.size > len(raw)] = False
+
+        kind = _TARGET_KIND[op]
+        addresses = numpy.arange(memory.base_address, memory.base_address + length, dtype=numpy.int32)
+        self.target = numpy.full(length, NO_TARGET, dtype=numpy.int32)
+        self.target = numpy.where(kind == _TARGET_U16, b1 | (b2 << 8), self.target)
+        self.target = numpy.where(kind == _TARGET_REL, addresses + 2 + ((b1 ^ 0x80) - 0x80), self.target)
+        self.target = numpy.where(kind == _TARGET_FIXED, _FIXED_TARGET[op], self.target)
+
+    def sizeAt(self, addr):
+        return int(self.size[addr - self.base_address])
+
+    def flowAt(self, addr):
+        return int(self.flow[addr - self.base_address])
+
+    def hasNextAt(self, addr):
+        return bool(self.has_next[addr - self.base_address])
+
+    def targetAt(self, addr):
+        target = int(self.target[addr - self.base_address])
+        if target == NO_TARGET:
+            return None
+        return target
+
+    def isPlainAt(self, addr):
+        return bool(self.plain[addr - self.base_address])
+
+    def isValidAt(self, addr):
+        return self.size[addr - self.base_address] != 0
@@ -1,6 +1,8 @@
-import struct
+import numpy
 
 from romInfo import RomInfo
+from memory.base import MARK_BITS
+from instrumentationFile import readInstrumentation
 
 
 ID_MASK = (0xFF << 32)
@@ -22,52 +24,53 @@ MARK_BANK_SHIFT = (48)
 MARK_BANK_MASK = (0xFFF << 48)
 
 
+# Records are processed in chunks, so huge instrumentation files do not need to fit in memory as intermediate arrays.
+CHUNK_RECORDS = 1 << 20
+
+
 def processInstrumentation(filename, ignore_banks_string):
-    f = open(filename, "rb")
-    banks_to_ignore = [int(bank, 16) for bank in ignore_banks_string.split(',')]
-    while True:
-        data = f.read(16)
-        if not data:
-            break
-        source, used_as = struct.unpack("<QQ", data)
-        if (source & ID_MASK) == ID_ROM:
-            addr = source & 0x3FFF
-            bank = (source >> 14) & 0x3FF
-            if bank in banks_to_ignore:
-                continue
-            if bank > 0:
-                addr |= 0x4000
-            
-            memory = RomInfo.romBank(bank)
-            if used_as & MARK_INSTR:
-                memory.mark(addr, "CODE")
-            if used_as & MARK_DATA:
-                memory.mark(addr, "DATA")
-                used_as_id = (used_as & ID_MASK)
-                used_as_addr = (used_as & 0xFFFF)
-                if used_as_id == ID_VRAM:
-                    if used_as_addr < 0x1800:
-                        if (used_as_addr & 1) == 0:
-                            memory.mark(addr, "GFX_LOW")
-                        else:
-                            memory.mark(addr, "GFX_HIGH")
-                    else:
-                        memory.mark(addr, "TILE")
-                elif used_as_id == ID_OAM:
-                    pass
-                elif used_as_id == ID_IO:
-                    pass
-                elif used_as_id == ID_ROM:
-                    if used_as_addr & 0xF000 == 0x2000:
-                        memory.mark(addr, "BANK")
-            if used_as & MARK_PTR_LOW:
-                memory.mark(addr, "PTR_LOW")
-            if used_as & MARK_PTR_HIGH:
-                memory.mark(addr, "PTR_HIGH")
-            if used_as & MARK_WORD_LOW:
-                memory.mark(addr, "WORD_LOW")
-            if used_as & MARK_WORD_HIGH:
-                memory.mark(addr, "WORD_HIGH")
+    banks_to_ignore = [int(bank, 16) for bank in ignore_banks_string.split(',') if bank.strip()]
+    records = readInstrumentation(filename)
+    for start in range(0, len(records), CHUNK_RECORDS):
+        _processRecords(records[start:start + CHUNK_RECORDS], banks_to_ignore)
+
+
+def _processRecords(records, banks_to_ignore):
+    source = records["source"]
+    used_as = records["used_as"]
+
+    bank = ((source >> 14) & 0x3FF).astype(numpy.int64)
+    keep = ((source & ID_MASK) == ID_ROM) & ~numpy.isin(bank, banks_to_ignore) & (bank < RomInfo.romBankCount())
+    source, used_as, bank = source[keep], used_as[keep], bank[keep]
+    addr = (source & 0x3FFF).astype(numpy.int64)
+    addr[bank > 0] |= 0x4000
+
+    used_as_id = used_as & ID_MASK
+    used_as_addr = used_as & 0xFFFF
+    is_data = (used_as & MARK_DATA) != 0
+    is_vram = is_data & (used_as_id == ID_VRAM)
+
+    bits = numpy.zeros(len(addr), dtype=numpy.uint16)
+    bits[(used_as & MARK_INSTR) != 0] |= MARK_BITS["CODE"]
+    bits[is_data] |= MARK_BITS["DATA"]
+    bits[is_vram & (used_as_addr < 0x1800) & ((used_as_addr & 1) == 0)] |= MARK_BITS["GFX_LOW"]
+    bits[is_vram & (used_as_addr < 0x1800) & ((used_as_addr & 1) == 1)] |= MARK_BITS["GFX_HIGH"]
+    bits[is_vram & (used_as_addr >= 0x1800)] |= MARK_BITS["TILE"]
+    bits[is_data & (used_as_id == ID_ROM) & ((used_as_addr & 0xF000) == 0x2000)] |= MARK_BITS["BANK"]
+    bits[(used_as & MARK_PTR_LOW) != 0] |= MARK_BITS["PTR_LOW"]
+    bits[(used_as & MARK_PTR_HIGH) != 0] |= MARK_BITS["PTR_HIGH"]
+    bits[(used_as & MARK_WORD_LOW) != 0] |= MARK_BITS["WORD_LOW"]
+    bits[(used_as & MARK_WORD_HIGH) != 0] |= MARK_BITS["WORD_HIGH"]
+
+    marked = bits != 0
+    for bank_nr in numpy.unique(bank[marked]):
+        in_bank = marked & (bank == bank_nr)
+        RomInfo.romBank(int(bank_nr)).addMarkBits(addr[in_bank], bits[in_bank])
 
-            if bank == 0 and (used_as & MARK_BANK_MASK) != 0 and (used_as & MARK_BANK_MASK) >> MARK_BANK_SHIFT:
-                memory.setActiveRomBankAt(addr, (used_as & MARK_BANK_MASK) >> MARK_BANK_SHIFT)
+    # The active rom bank for code in bank 0, in file order so the last record for an address wins.
+    active_bank = (used_as & MARK_BANK_MASK) >> MARK_BANK_SHIFT
+    with_bank = (bank == 0) & (active_bank != 0)
+    if with_bank.any():
+        memory = RomInfo.romBank(0)
+        for a, b in zip(addr[with_bank].tolist(), active_bank[with_bank].tolist()):
+            memory.setActiveRomBankAt(a, b)
@@ -0,0 +1,104 @@
+import lzma
+import os
+import struct
+import zlib
+
+import numpy
+
+
+# Instrumentation files come in two formats:
+# The dense format is a plain list of (source, used_as) records of two little endian 64 bit values each.
+# The sparse format starts with a header, followed by a payload that is optionally compressed:
+#   "BBIS", u8 version, u8 compression, u16 reserved, u64 record count
+#   count LEB128 varints with the zigzag encoded difference between the source of a record and the previous one
+#   count little endian 64 bit used_as values
+RECORD_DTYPE = numpy.dtype([("source", "<u8"), ("used_as", "<u8")])
+
+SPARSE_MAGIC = b"BBIS"
+SPARSE_VERSION = 1
+SPARSE_HEADER = struct.Struct("<4sBBHQ")
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZMA = 2
+COMPRESSION_NAMES = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "lzma": COMPRESSION_LZMA}
+
+
+def isSparseInstrumentation(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(SPARSE_MAGIC)) == SPARSE_MAGIC
+
+
+# Read an instrumentation file in either format, as an array of RECORD_DTYPE.
+# Dense files are memory mapped, so large files are only read as far as they are used.
+def readInstrumentation(filename):
+    if os.path.getsize(filename) == 0:
+        return numpy.zeros(0, dtype=RECORD_DTYPE)
+    if not isSparseInstrumentation(filename):
+        return numpy.memmap(filename, dtype=RECORD_DTYPE, mode="r")
+
+    with open(filename, "rb") as f:
+        magic, version, compression, _, count = SPARSE_HEADER.unpack(f.read(SPARSE_HEADER.size))
+        payload = f.read()
+    if version != SPARSE_VERSION:
+        raise ValueError("%s: unsupported sparse instrumentation version %d" % (filename, version))
+    if compression == COMPRESSION_ZLIB:
+        payload = zlib.decompress(payload)
+    elif compression == COMPRESSION_LZMA:
+        payload = lzma.decompress(payload)
+    elif compression != COMPRESSION_NONE:
+        raise ValueError("%s: unknown compression %d" % (filename, compression))
+
+    payload = numpy.frombuffer(payload, dtype=numpy.uint8)
+    deltas, size = _decodeVarints(payload, count)
+    if len(payload) != size + count * 8:
+        raise ValueError("%s: sparse instrumentation payload has the wrong size" % (filename))
+    records = numpy.zeros(count, dtype=RECORD_DTYPE)
+    deltas = (deltas >> numpy.uint64(1)) ^ (numpy.uint64(0) - (deltas & numpy.uint64(1)))
+    records["source"] = numpy.cumsum(deltas, dtype=numpy.uint64)
+    records["used_as"] = payload[size:].view("<u8")
+    return records
+
+
+# Write records, any array with source and used_as fields, in the sparse format. Records with used_as == 0 are left out.
+def writeSparseInstrumentation(filename, records, *, compression=COMPRESSION_ZLIB):
+    records = records[records["used_as"] != 0]
+    source = numpy.asarray(records["source"], dtype=numpy.uint64)
+    deltas = numpy.diff(source, prepend=numpy.uint64(0))
+    deltas = (deltas << numpy.uint64(1)) ^ (numpy.uint64(0) - (deltas >> numpy.uint64(63)))
+    payload = _encodeVarints(deltas).tobytes() + numpy.asarray(records["used_as"], dtype="<u8").tobytes()
+    if compression == COMPRESSION_ZLIB:
+        payload = zlib.compress(payload, 9)
+    elif compression == COMPRESSION_LZMA:
+        payload = lzma.compress(payload)
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(SPARSE_HEADER.pack(SPARSE_MAGIC, SPARSE_VERSION, compression, 0, len(records)))
+        f.write(payload)
+    os.replace(tmp_filename, filename)
+
+
+def _decodeVarints(data, count):
+    if count == 0:
+        return numpy.zeros(0, dtype=numpy.uint64), 0
+    ends = numpy.flatnonzero((data & 0x80) == 0)[:count]
+    if len(ends) < count:
+        raise ValueError("Sparse instrumentation data is truncated")
+    size = int(ends[-1]) + 1
+    starts = numpy.concatenate(([0], ends[:-1] + 1))
+    position = numpy.arange(size) - numpy.repeat(starts, ends - starts + 1)
+    values = (data[:size] & 0x7F).astype(numpy.uint64) << (position * 7).astype(numpy.uint64)
+    return numpy.add.reduceat(values, starts), size
+
+
+def _encodeVarints(values):
+    nbytes = numpy.ones(len(values), dtype=numpy.int64)
+    for n in range(1, 10):
+        nbytes += values >= (numpy.uint64(1) << numpy.uint64(7 * n))
+    offsets = numpy.cumsum(nbytes) - nbytes
+    result = numpy.zeros(int(nbytes.sum()), dtype=numpy.uint8)
+    for n in range(10):
+        selected = nbytes > n
+        byte = ((values[selected] >> numpy.uint64(7 * n)) & numpy.uint64(0x7F)).astype(numpy.uint8)
+        byte[nbytes[selected] > n + 1] |= 0x80
+        result[offsets[selected] + n] = byte
+    return result
@@ -9,6 +9,9 @@ import sys
 from rom import ROM
 from disassembler import Disassembler
 from instrumentation import processInstrumentation
+from analysisCache import AnalysisCache
+from sourceReader import SourceCache
+from profiler import Profiler
 from annotation import annotation
 from annotation import simple
 from annotation import value
@@ -26,6 +29,14 @@ if __name__ == "__main__":
     parser.add_argument("--output", type=str, required=False)
     parser.add_argument("--plugin", action='append', default=[])
     parser.add_argument("--list-annotations", action="store_true")
+    parser.add_argument("--mmap", action="store_true", help="Map the rom file into memory instead of reading it")
+    parser.add_argument("--jobs", type=int, default=1, help="Export rom banks in parallel with this many processes, the output is the same as a serial export")
+    parser.add_argument("--trace-jobs", type=int, default=1, help="Trace rom banks in parallel with this many processes. The result can differ from serial tracing, where code reached through bank 0 or through code hooks overlaps code found in a bank")
+    parser.add_argument("--xrefs", choices=["comments", "file", "both"], help="Export cross references as comments below the labels, as xrefs.txt in the output folder, or both")
+    parser.add_argument("--profile", type=str, metavar="REPORT_JSON", help="Measure the time of every phase, bank and annotation, and write the report to this file")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile, also measure the peak memory use. This makes the run many times slower, so the times in the report are not representative")
+    parser.add_argument("--split-size", type=int, metavar="BYTES", help="Split rom banks at global labels into files of about this size in src/split, which are assembled separately")
+    parser.add_argument("--cache", action="store_true", help="Store the analysis and the parsed sources in the output folder. The analysis is reused only if the rom, instrumentation, plugins, disassembler, serial or parallel tracing (--trace-jobs) and all labels and annotations are unchanged; any change, even in a single bank, analyses the whole rom again. Parsed source files are reused per file while the file is unchanged")
     args = parser.parse_args()
 
     if not args.rom and not args.list_annotations:
@@ -67,13 +78,42 @@ if __name__ == "__main__":
             print("")
 
     if args.rom:
-        rom = ROM(args.rom)
+        if args.profile:
+            Profiler.enable(memory=args.profile_memory)
+        rom = ROM(args.rom, use_mmap=args.mmap)
         disassembler = Disassembler(rom, args.wram_banks)
-        disassembler.readSources(args.source if args.source else args.output)
-        for instrumentation_file in args.instrumentation:
-            processInstrumentation(instrumentation_file, args.instrumentation_ignore_banks)
-        disassembler.processRom()
+        source_cache = None
+        if args.cache and args.output:
+            source_cache = SourceCache(os.path.join(args.output, ".cache", "sources.pickle"))
+        with Profiler.phase("read sources"):
+            disassembler.readSources(args.source if args.source else args.output, cache=source_cache)
+        cache = None
+        if args.cache and args.output:
+            cache = AnalysisCache(os.path.join(args.output, ".cache", "analysis.pickle"), rom, wram_banks=args.wram_banks,
+                instrumentation_files=args.instrumentation, instrumentation_ignore_banks=args.instrumentation_ignore_banks, plugins=args.plugin,
+                trace_jobs=args.trace_jobs)
+            cache.fingerprintSources()
+        with Profiler.phase("load cache"):
+            cached = cache is not None and cache.load()
+        if not cached:
+            with Profiler.phase("instrumentation"):
+                for instrumentation_file in args.instrumentation:
+                    with Profiler.item("instrumentation file", instrumentation_file):
+                        processInstrumentation(instrumentation_file, args.instrumentation_ignore_banks)
+            with Profiler.phase("process rom"):
+                disassembler.processRom(jobs=args.trace_jobs)
+            if cache is not None:
+                with Profiler.phase("store cache"):
+                    cache.snapshot()
         if args.output:
-            disassembler.export(args.output)
+            with Profiler.phase("export"):
+                disassembler.export(args.output, xrefs=args.xrefs, jobs=args.jobs, split_size=args.split_size)
+            if cache is not None:
+                with Profiler.phase("store cache"):
+                    cache.save()
+                    source_cache.save()
         else:
             print("Warning: no output folder specified. Not generating output")
+        if args.profile:
+            Profiler.printSummary()
+            Profiler.writeReport(args.profile)
@@ -1,67 +1,249 @@
+import bisect
+import numpy
+
 from autoLabel import AutoLabel
 
 
+# Boolean marks are stored as bits in a per address array, as instrumentation sets multiple marks on most rom bytes.
+# Any other mark, and marks with a value (PTR_BANK, PTR_TARGET), are stored in a table per mark.
+MARK_BITS = {
+    "CODE": 0x0001,
+    "DATA": 0x0002,
+    "GFX_LOW": 0x0004,
+    "GFX_HIGH": 0x0008,
+    "PTR_LOW": 0x0010,
+    "PTR_HIGH": 0x0020,
+    "WORD_LOW": 0x0040,
+    "WORD_HIGH": 0x0080,
+    "TILE": 0x0100,
+    "BANK": 0x0200,
+    "PTR": 0x0400,
+}
+
+
 class Memory:
     def __init__(self, type, size, *, base_address=0):
-        self.__blocks = [None] * size
+        self.__size = size
+        # Blocks are stored as sorted, non overlapping [start, end) spans with the block that owns them.
+        self.__block_starts = []
+        self.__block_ends = []
+        self.__block_owners = []
         self.__labels = {}
+        # Sorted addresses of all labels that are not False, for fast lookups of the label before an address.
+        self.__label_addrs = []
+        # Rendered labels and the address of the global label that every address is part of, see buildLabelScopes.
+        self.__label_strings = None
+        self.__label_scopes = None
         self.__comments = {}
         self.__inline_comment = {}
+        self.__mark_bits = None
         self.__marks = {}
         self.__value_format = {}
         self.__include_start = {}
         self.__include_end = {}
         self.__section_starts = {}
+        self.__xrefs = {}
+        # Sorted lists of the xrefs of every address, see sortXrefs.
+        self.__sorted_xrefs = None
+        self.__recorder = None
         self.base_address = base_address
         self.type = type
 
     def __len__(self):
-        return len(self.__blocks)
+        return self.__size
 
     def __getitem__(self, index):
-        return self.__blocks[index - self.base_address]
+        if not 0 <= index - self.base_address < self.__size:
+            raise IndexError("$%04x outside of %s" % (index, self.type))
+        n = bisect.bisect_right(self.__block_starts, index) - 1
+        if n >= 0 and index < self.__block_ends[n]:
+            return self.__block_owners[n]
+        return None
 
     def __setitem__(self, index, value):
         if value is None:
-            assert self.__blocks[index - self.base_address] != None
-            self.__blocks[index - self.base_address] = value
+            self.releaseBlockRange(index, index + 1)
+        else:
+            self.claimBlockRange(index, index + 1, value)
+
+    # Assign the range [start, end) to a block, the range has to be free.
+    def claimBlockRange(self, start, end, block):
+        assert self.base_address <= start and end <= self.base_address + self.__size, "$%04x-$%04x %s" % (start, end, block)
+        n = bisect.bisect_right(self.__block_starts, start)
+        assert self.isFreeBlockRange(start, end), "$%04x %s %s" % (start, self[self.nextClaimedAddress(start)], block)
+        if n > 0 and self.__block_ends[n - 1] == start and self.__block_owners[n - 1] is block:
+            self.__block_ends[n - 1] = end
+            if n < len(self.__block_starts) and self.__block_starts[n] == end and self.__block_owners[n] is block:
+                self.__block_ends[n - 1] = self.__block_ends[n]
+                del self.__block_starts[n], self.__block_ends[n], self.__block_owners[n]
+        elif n < len(self.__block_starts) and self.__block_starts[n] == end and self.__block_owners[n] is block:
+            self.__block_starts[n] = start
         else:
-            # assert isinstance(value, Block)
-            assert self.__blocks[index - self.base_address] == None, "$%04x %s %s" % (index, self.__blocks[index - self.base_address], value)
-            self.__blocks[index - self.base_address] = value
+            self.__block_starts.insert(n, start)
+            self.__block_ends.insert(n, end)
+            self.__block_owners.insert(n, block)
+
+    # Remove the blocks from the range [start, end), every address in the range has to be owned by a block.
+    def releaseBlockRange(self, start, end):
+        n = bisect.bisect_right(self.__block_starts, start) - 1
+        while start < end:
+            assert n >= 0 and n < len(self.__block_starts) and self.__block_starts[n] <= start < self.__block_ends[n], "$%04x not part of a block" % (start)
+            span_start, span_end, owner = self.__block_starts[n], self.__block_ends[n], self.__block_owners[n]
+            release_end = min(end, span_end)
+            if span_start < start and release_end < span_end:
+                self.__block_ends[n] = start
+                self.__block_starts.insert(n + 1, release_end)
+                self.__block_ends.insert(n + 1, span_end)
+                self.__block_owners.insert(n + 1, owner)
+                n += 2
+            elif span_start < start:
+                self.__block_ends[n] = start
+                n += 1
+            elif release_end < span_end:
+                self.__block_starts[n] = release_end
+            else:
+                del self.__block_starts[n], self.__block_ends[n], self.__block_owners[n]
+            start = release_end
+
+    def isFreeBlockRange(self, start, end):
+        n = bisect.bisect_right(self.__block_starts, start) - 1
+        if n >= 0 and self.__block_ends[n] > start:
+            return False
+        return n + 1 >= len(self.__block_starts) or self.__block_starts[n + 1] >= end
+
+    # First address at or after addr that is part of a block, or None.
+    def nextClaimedAddress(self, addr):
+        n = bisect.bisect_right(self.__block_starts, addr) - 1
+        if n >= 0 and self.__block_ends[n] > addr:
+            return addr
+        if n + 1 < len(self.__block_starts):
+            return self.__block_starts[n + 1]
+        return None
+
+    # All (start, end, block) spans, in address order. A block can be split over multiple spans.
+    def getAllBlockSpans(self):
+        return zip(self.__block_starts, self.__block_ends, self.__block_owners)
 
     def addLabel(self, addr, label):
-        assert addr >= self.base_address and addr < self.base_address + len(self.__blocks), "%04x: %s" % (addr, label)
-        self.__labels[addr] = label
+        assert addr >= self.base_address and addr < self.base_address + self.__size, "%04x: %s" % (addr, label)
+        self.__setLabel(addr, label)
     
     def addAutoLabel(self, addr, source, type):
-        assert addr >= self.base_address and addr < self.base_address + len(self.__blocks)
+        assert addr >= self.base_address and addr < self.base_address + self.__size
+
+        if self.__recorder is not None:
+            self.__recorder.autoLabel(self, addr, source, type)
+            return
+        self._addAutoLabel(addr, source, type)
 
+    # Memory types override this to name their auto labels, instead of addAutoLabel, so a recorder always sees them.
+    def _addAutoLabel(self, addr, source, type):
         label = self.__labels.get(addr, None)
         if label == None:
             label = AutoLabel(self, addr)
-            self.__labels[addr] = label
+            self.__setLabel(addr, label)
         if not isinstance(label, AutoLabel):
             return
         label.addSource(source, type)
 
+    # While a recorder is set, auto labels and cross references are passed to its autoLabel and xref methods instead of
+    # being added to this memory. Used by parallel tracing, where the workers send them to the parent process.
+    def setRecorder(self, recorder):
+        self.__recorder = recorder
+
     def ensureNoLabel(self, addr):
-        self.__labels[addr] = False
+        self.__setLabel(addr, False)
+
+    def __setLabel(self, addr, label):
+        self.dropLabelScopes()
+        was_indexed = self.__labels.get(addr, False) is not False
+        self.__labels[addr] = label
+        if label is False:
+            if was_indexed:
+                del self.__label_addrs[bisect.bisect_left(self.__label_addrs, addr)]
+        elif not was_indexed:
+            bisect.insort(self.__label_addrs, addr)
 
     def getLabel(self, addr):
         return self.__labels.get(addr, None)
     
+    # Render every label once, and find the global label (without a ".") that every address is part of.
+    # Used for the export, when the labels are final. Adding or changing a label drops this again.
+    def buildLabelScopes(self):
+        self.__label_strings = {addr: str(self.__labels[addr]) for addr in self.__label_addrs}
+        global_addrs = numpy.array([addr for addr in self.__label_addrs if "." not in self.__label_strings[addr]], dtype=numpy.int32)
+        scopes = numpy.full(self.__size, -1, dtype=numpy.int32)
+        if len(global_addrs):
+            index = numpy.searchsorted(global_addrs, numpy.arange(self.base_address, self.base_address + self.__size), side="right") - 1
+            scopes[index >= 0] = global_addrs[index[index >= 0]]
+        self.__label_scopes = scopes
+
+    # Called when a label changes, including when the name of an AutoLabel changes by a new source or its local flag.
+    def dropLabelScopes(self):
+        self.__label_strings = None
+        self.__label_scopes = None
+
+    # Same as str(getLabel(addr)), or None if there is no label.
+    def getLabelString(self, addr):
+        if self.__label_strings is not None:
+            return self.__label_strings.get(addr)
+        label = self.__labels.get(addr)
+        if not label:
+            return None
+        return str(label)
+
+    # Same as str(getLabelBefore(addr, local=False)), or None if there is no global label at or before addr.
+    def getScopeLabelString(self, addr):
+        if self.__label_scopes is not None and 0 <= addr - self.base_address < self.__size:
+            scope = self.__label_scopes[addr - self.base_address]
+            if scope < 0:
+                return None
+            return self.__label_strings[int(scope)]
+        label = self.getLabelBefore(addr, local=False)
+        if label is None:
+            return None
+        return str(label)
+
     def getLabelBefore(self, addr, *, local=True):
-        while addr >= 0 and (addr not in self.__labels or self.__labels[addr] == False):
-            addr -= 1
-        res = self.__labels.get(addr, None)
-        if not local and "." in str(res):
-            return self.getLabelBefore(addr - 1, local=False)
-        return res
+        index = bisect.bisect_right(self.__label_addrs, addr) - 1
+        while index >= 0:
+            res = self.__labels[self.__label_addrs[index]]
+            if local or "." not in str(res):
+                return res
+            index -= 1
+        return None
 
     def getAllLabels(self):
         return self.__labels.items()
 
+    # Cross references to an address, as a set of (source bank, source address, kind) per target address.
+    # Kind is the instruction type for code flow (call, jp, jr, rst), or read, write, ptr, jumptable, farcall.
+    def addXref(self, addr, source_bank, source_addr, kind):
+        if self.__recorder is not None:
+            self.__recorder.xref(self, addr, source_bank, source_addr, kind)
+            return
+        self.__sorted_xrefs = None
+        xrefs = self.__xrefs.get(addr)
+        if xrefs is None:
+            xrefs = set()
+            self.__xrefs[addr] = xrefs
+        xrefs.add((source_bank, source_addr, kind))
+
+    # Sort the xrefs of every address once, for the export. Adding an xref drops this again.
+    def sortXrefs(self):
+        self.__sorted_xrefs = {addr: sorted(xrefs) for addr, xrefs in self.__xrefs.items()}
+
+    def getXrefs(self, addr):
+        if self.__sorted_xrefs is None:
+            self.sortXrefs()
+        return self.__sorted_xrefs.get(addr, [])
+
+    # The sorted xrefs of every address.
+    def getAllXrefs(self):
+        if self.__sorted_xrefs is None:
+            self.sortXrefs()
+        return self.__sorted_xrefs.items()
+
     def addComment(self, addr, comment):
         if addr not in self.__comments:
             self.__comments[addr] = []
@@ -97,6 +279,33 @@ class Memory:
     def getIncludeEnd(self, addr):
         return self.__include_end.get(addr, 0)
 
+    def getAllIncludeStarts(self):
+        return self.__include_start.items()
+
+    def getAllIncludeEnds(self):
+        return self.__include_end.items()
+
+    # Take the comments and includes read from the sources from another memory of the same type.
+    def takeSourceInfo(self, other):
+        self.__comments = other.__comments
+        self.__inline_comment = other.__inline_comment
+        self.__include_start = other.__include_start
+        self.__include_end = other.__include_end
+        if hasattr(other, "main_filename"):
+            self.main_filename = other.main_filename
+
+    # True when only blocks were added to this memory: no labels, comments, includes, sections, marks or value formats.
+    def isBare(self):
+        if self.__labels or self.__comments or self.__inline_comment or self.__include_start or self.__include_end:
+            return False
+        if self.__section_starts or self.__marks or self.__value_format or self.__mark_bits is not None:
+            return False
+        return True
+
+    # True when any mark was set in this memory.
+    def hasAnyMark(self):
+        return bool(self.__marks) or (self.__mark_bits is not None and self.__mark_bits.any())
+
     def addSectionStart(self, addr, name):
         self.__section_starts[addr] = name
 
@@ -104,17 +313,65 @@ class Memory:
         return self.__section_starts.get(addr, None)
 
     def mark(self, addr, mark, value=True):
-        if addr not in self.__marks:
-            self.__marks[addr] = {}
-        self.__marks[addr][mark] = value
+        if not 0 <= addr - self.base_address < self.__size:
+            raise IndexError("$%04x outside of %s" % (addr, self.type))
+        bit = MARK_BITS.get(mark)
+        if bit is not None and value is True:
+            self.__markBits()[addr - self.base_address] |= bit
+        else:
+            if mark not in self.__marks:
+                self.__marks[mark] = {}
+            self.__marks[mark][addr] = value
+
+    # Set a boolean mark on an array of addresses at once.
+    def markAddresses(self, addrs, mark):
+        self.__markBits()[self.__markOffsets(addrs)] |= MARK_BITS[mark]
+
+    # Combine an array of MARK_BITS values into the marks of an array of addresses, addresses can repeat.
+    def addMarkBits(self, addrs, bits):
+        numpy.bitwise_or.at(self.__markBits(), self.__markOffsets(addrs), numpy.asarray(bits, dtype=numpy.uint16))
+
+    # Offsets of an array of addresses, checked like mark() does, as numpy would wrap negative offsets around.
+    def __markOffsets(self, addrs):
+        offsets = numpy.asarray(addrs, dtype=numpy.int64) - self.base_address
+        outside = (offsets < 0) | (offsets >= self.__size)
+        if outside.any():
+            raise IndexError("$%04x outside of %s" % (offsets[outside][0] + self.base_address, self.type))
+        return offsets
 
     def hasMark(self, addr, mark):
-        if addr not in self.__marks:
-            return False
-        return mark in self.__marks[addr]
+        bit = MARK_BITS.get(mark)
+        if bit is not None and self.__mark_bits is not None:
+            offset = addr - self.base_address
+            if 0 <= offset < len(self.__mark_bits) and self.__mark_bits[offset] & bit:
+                return True
+        return mark in self.__marks and addr in self.__marks[mark]
 
     def markValue(self, addr, mark):
-        return self.__marks[addr][mark]
+        if mark in self.__marks and addr in self.__marks[mark]:
+            return self.__marks[mark][addr]
+        if self.hasMark(addr, mark):
+            return True
+        raise KeyError(mark)
+
+    # Boolean array with an entry for every address of this memory, set where the mark is set.
+    def markArray(self, mark):
+        result = numpy.zeros(self.__size, dtype=numpy.bool_)
+        bit = MARK_BITS.get(mark)
+        if bit is not None and self.__mark_bits is not None:
+            result |= (self.__mark_bits & bit) != 0
+        for addr in self.__marks.get(mark, ()):
+            result[addr - self.base_address] = True
+        return result
+
+    # All addresses that have the mark set, in increasing order.
+    def addressesWithMark(self, mark):
+        return numpy.flatnonzero(self.markArray(mark)) + self.base_address
+
+    def __markBits(self):
+        if self.__mark_bits is None:
+            self.__mark_bits = numpy.zeros(self.__size, dtype=numpy.uint16)
+        return self.__mark_bits
 
     def setValueFormatFunction(self, addr, func):
         assert addr not in self.__value_format
@@ -61,7 +61,7 @@ class IOMemory(Memory):
         IOReg(self, 0xFF6B, "rOCPD")
         IOReg(self, 0xFF70, "rSVBK")
 
-    def addAutoLabel(self, addr, source, type):
+    def _addAutoLabel(self, addr, source, type):
         pass
 
 
@@ -5,7 +5,7 @@ class VRamMemory(Memory):
     def __init__(self):
         super().__init__("vram", 0x2000, base_address=0x8000)
 
-    def addAutoLabel(self, addr, source, type):
+    def _addAutoLabel(self, addr, source, type):
         if self.getLabel(addr) == None:
             self.addLabel(addr, "v%04X" % (addr))
 
@@ -13,7 +13,7 @@ class SRamMemory(Memory):
     def __init__(self):
         super().__init__("sram", 0x2000, base_address=0xA000)
 
-    def addAutoLabel(self, addr, source, type):
+    def _addAutoLabel(self, addr, source, type):
         if self.getLabel(addr) == None:
             self.addLabel(addr, "s%04X" % (addr))
 
@@ -21,7 +21,7 @@ class WRamMemory(Memory):
     def __init__(self):
         super().__init__("wram0", 0x2000, base_address=0xC000)
 
-    def addAutoLabel(self, addr, source, type):
+    def _addAutoLabel(self, addr, source, type):
         if self.getLabel(addr) == None:
             self.addLabel(addr, "w%04X" % (addr))
 
@@ -34,7 +34,7 @@ class WRamMemoryBanked(Memory):
     def bankNumber(self):
         return self.__bank
 
-    def addAutoLabel(self, addr, source, type):
+    def _addAutoLabel(self, addr, source, type):
         if self.getLabel(addr) == None:
             if self.__bank == 0:
                 self.addLabel(addr, "w%04X" % (addr))
@@ -45,7 +45,7 @@ class OAMMemory(Memory):
     def __init__(self):
         super().__init__("oam", 0x00A0, base_address=0xFE00)
 
-    def addAutoLabel(self, addr, source, type):
+    def _addAutoLabel(self, addr, source, type):
         if self.getLabel(addr) == None:
             self.addLabel(addr, "oam%04X" % (addr))
 
@@ -53,6 +53,6 @@ class HRamMemory(Memory):
     def __init__(self):
         super().__init__("hram", 0x007F, base_address=0xFF80)
 
-    def addAutoLabel(self, addr, source, type):
+    def _addAutoLabel(self, addr, source, type):
         if self.getLabel(addr) == None:
             self.addLabel(addr, "h%04X" % (addr))
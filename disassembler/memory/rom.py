@@ -1,4 +1,8 @@
+import numpy
+
 from .base import Memory
+from instruction import Instruction
+from instructionIndex import InstructionIndex
 
 
 class RomMemory(Memory):
@@ -6,9 +10,27 @@ class RomMemory(Memory):
         super().__init__("rom%x" % (bank), 0x4000, base_address=0x0000 if bank == 0 else 0x4000)
         self.__bank = bank
         self.__rom = rom
+        # Offset to go from an address in this bank to an offset in the rom data.
+        self.__offset = bank * 0x4000 - self.base_address
+        self.__data = rom.buffer()
         self.__active_rom_bank_per_addr = {}
+        self.__instructions = {}
+        self.__instruction_index = None
         self.main_filename = "src/bank%02X.asm" % (bank)
 
+    def __getstate__(self):
+        # Decoded instructions are cheap to recreate, so do not store them when this memory is pickled.
+        state = self.__dict__.copy()
+        state["_RomMemory__instructions"] = {}
+        state["_RomMemory__instruction_index"] = None
+        # The rom data can be a memoryview on a mapped file, which cannot be pickled. It is taken from the rom again on unpickling.
+        del state["_RomMemory__data"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__data = self.__rom.buffer()
+
     @property
     def bankNumber(self):
         return self.__bank
@@ -22,18 +44,43 @@ class RomMemory(Memory):
         assert self.__bank == 0
         self.__active_rom_bank_per_addr[addr] = bank_nr
 
+    # Decoded instructions are cached per address, as the rom never changes they never need to be invalidated.
+    # The returned instruction is shared, and should not be modified.
+    def instruction(self, addr):
+        instr = self.__instructions.get(addr)
+        if instr is None:
+            instr = Instruction(self, addr)
+            self.__instructions[addr] = instr
+        return instr
+
+    # Vectorized index of the instruction at every address of this bank, built on first use.
+    def instructionIndex(self):
+        if self.__instruction_index is None:
+            self.__instruction_index = InstructionIndex(self)
+        return self.__instruction_index
+
+    # The value of every byte in this bank for banks that are only $00 or $FF padding, else None.
+    def fillByte(self):
+        return self.__rom.bankFillByte(self.__bank)
+
     def data(self, addr, size):
-        addr = addr - self.base_address + self.__bank * 0x4000
-        return self.__rom[addr:addr+size]
+        return bytes(self.bytesView(addr, size))
+
+    # Zero-copy view on size bytes starting at addr. Like data, this can continue past the end of the bank.
+    def bytesView(self, addr, size):
+        return self.__rom.view(addr + self.__offset, size)
+
+    # Array of amount little endian words starting at addr, without copying the rom data.
+    def words(self, addr, amount):
+        return numpy.frombuffer(self.bytesView(addr, amount * 2), dtype="<u2", count=amount)
 
     def byte(self, addr):
-        addr = addr - self.base_address + self.__bank * 0x4000
-        return self.__rom[addr]
+        return self.__data[addr + self.__offset]
 
     def word(self, addr):
-        addr = addr - self.base_address + self.__bank * 0x4000
-        return (self.__rom[addr]) | (self.__rom[addr + 1] << 8)
+        addr += self.__offset
+        return (self.__data[addr]) | (self.__data[addr + 1] << 8)
 
     def wordBE(self, addr):
-        addr = addr - self.base_address + self.__bank * 0x4000
-        return (self.__rom[addr] << 8) | (self.__rom[addr + 1])
+        addr += self.__offset
+        return (self.__data[addr] << 8) | (self.__data[addr + 1])
@@ -0,0 +1,46 @@
+import multiprocessing
+import sys
+import time
+
+from profiler import Profiler
+from assemblyFile import write_statistics
+
+
+# Set before the worker processes are forked, so the workers inherit it together with the rest of the analysis state.
+_export_bank = None
+
+
+# Parallel version of calling export_bank on every rom bank number.
+# Exporting a bank only reads the analysis and writes the files of that bank (the bank file, its includes and images),
+# so every bank is exported in a forked worker that inherits the analysed state, and writes its own files.
+# The files are exactly the same as when exported serially, only the order in which they are written differs.
+def exportBanksParallel(bank_nrs, jobs, export_bank):
+    global _export_bank
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("Parallel export needs fork() support, exporting on a single core")
+        for bank_nr in bank_nrs:
+            print("Exporting bank: %02x" % (bank_nr))
+            with Profiler.item("export bank", "%02x" % (bank_nr)):
+                export_bank(bank_nr)
+        return
+
+    _export_bank = export_bank
+    print("Exporting %d banks with %d jobs" % (len(bank_nrs), jobs))
+    sys.stdout.flush()
+    with multiprocessing.get_context("fork").Pool(jobs, initializer=Profiler.initWorker) as pool:
+        for bank_nr, wall, cpu, written, unchanged in pool.imap(_exportBank, bank_nrs, chunksize=1):
+            print("Exported bank: %02x (%.3fs)" % (bank_nr, wall))
+            write_statistics.written += written
+            write_statistics.unchanged += unchanged
+            Profiler.addItem("export bank", "%02x" % (bank_nr), wall=wall, cpu=cpu)
+
+
+def _exportBank(bank_nr):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    # Workers are reused for multiple banks, only return what this bank added to the write statistics.
+    written, unchanged = write_statistics.written, write_statistics.unchanged
+    _export_bank(bank_nr)
+    sys.stdout.flush()
+    return bank_nr, time.perf_counter() - wall, time.process_time() - cpu, write_statistics.written - written, write_statistics.unchanged - unchanged
@@ -0,0 +1,171 @@
+import multiprocessing
+import sys
+
+from romInfo import RomInfo
+from profiler import Profiler
+from instruction import CALL, RST
+from block.code import CodeBlock, TraceStatistics, TraceScopeError
+from block.gfx import GfxBlock
+from block.header import NoExport00
+from annotation.simple import DataBlock
+
+
+# Set before the worker processes are forked, so the workers inherit it together with the rest of the analysis state.
+_classify = None
+
+
+# Parallel version of running classify on every existing rom bank, and closing every bank with NoExport00.
+# Returns the numbers of the banks that were closed.
+# Bank 0 is processed in this process first. After that, code in banks 1..N can only reach its own bank and bank 0,
+# so each of those banks is traced in a forked worker that only traces inside its own bank.
+# Workers return the blocks they found, the auto labels and cross references they added and the targets outside of their bank,
+# which are merged here in bank order, after which the targets outside of the banks are traced.
+# Banks that call into hooks of CodeBlock subclasses (from annotations or plugins) cannot be traced in isolation,
+# those are traced serially after everything else is merged. Because of this different order, the result can differ
+# from serial tracing where code traced through bank 0 or hooks overlaps with code found in other banks.
+def traceBanksParallel(jobs, classify):
+    global _classify
+
+    bank0 = RomInfo.romBank(0)
+    classify(bank0)
+    NoExport00(bank0, bank0.base_address + len(bank0))
+    # Tracing bank 0 can create other banks, so these are only listed now.
+    banks = list(RomInfo.existingRomBanks())
+    if len(banks) < 2:
+        return {0}
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("Parallel tracing needs fork() support, tracing on a single core")
+        for bank in banks[1:]:
+            classify(bank)
+            NoExport00(bank, bank.base_address + len(bank))
+        return set(bank.bankNumber for bank in banks)
+
+    _classify = classify
+    print("Tracing %d banks with %d jobs" % (len(banks) - 1, jobs))
+    print("Note: parallel tracing can find different code and labels than serial tracing, where code reached through bank 0 or code hooks overlaps code found in a bank")
+    sys.stdout.flush()
+    with multiprocessing.get_context("fork").Pool(jobs, initializer=Profiler.initWorker) as pool:
+        results = pool.map(_traceBank, [bank.bankNumber for bank in banks[1:]], chunksize=1)
+
+    serial_banks = []
+    cross_bank_targets = []
+    for bank, result in zip(banks[1:], results):
+        if result is None:
+            serial_banks.append(bank)
+            continue
+        blocks, labels, xrefs, cross, statistics = result
+        for block in blocks:
+            _replayBlock(bank, block)
+        for key, addr, source, type in labels:
+            RomInfo.memoryByKey(key).addAutoLabel(addr, source, type)
+        for key, addr, source_bank, source_addr, kind in xrefs:
+            RomInfo.memoryByKey(key).addXref(addr, source_bank, source_addr, kind)
+        cross_bank_targets += cross
+        _mergeStatistics(statistics)
+        NoExport00(bank, bank.base_address + len(bank))
+
+    for key, target, from_key, from_addr, instr_type, instr_size in cross_bank_targets:
+        _traceCrossBankTarget(RomInfo.memoryByKey(key), target, RomInfo.memoryByKey(from_key), from_addr, instr_type, instr_size)
+
+    if serial_banks:
+        print("Tracing %d banks serially, as they use code hooks: %s" % (len(serial_banks), ", ".join("%02x" % (bank.bankNumber) for bank in serial_banks)))
+    for bank in serial_banks:
+        classify(bank)
+        NoExport00(bank, bank.base_address + len(bank))
+    return set(bank.bankNumber for bank in banks)
+
+
+def _traceBank(bank_nr):
+    bank = RomInfo.romBank(bank_nr)
+    memories = RomInfo.getAllMemories()
+    existing_blocks = set(id(block) for _, _, block in bank.getAllBlockSpans())
+
+    # Auto labels and cross references are only recorded, the parent process adds them to its own memories.
+    recorder = _Recorder()
+    CodeBlock.statistics = TraceStatistics()
+    CodeBlock.cross_bank_targets = []
+    CodeBlock.trace_scope = bank
+    try:
+        for memory in memories:
+            memory.setRecorder(recorder)
+        _classify(bank)
+    except TraceScopeError:
+        return None
+    finally:
+        CodeBlock.trace_scope = None
+        for memory in memories:
+            memory.setRecorder(None)
+    labels = recorder.labels
+    xrefs = recorder.xrefs
+    # A bank created by the trace did not have the recorder set, trace serially to not lose its labels.
+    if len(RomInfo.getAllMemories()) != len(memories):
+        return None
+
+    blocks = []
+    for addr, _, block in list(bank.getAllBlockSpans()):
+        if id(block) in existing_blocks or block.base_address != addr:
+            continue
+        if type(block) is CodeBlock:
+            no_label = [n for n in range(addr, addr + len(block)) if bank.getLabel(n) is False]
+            blocks.append(("code", addr, len(block), no_label))
+        elif type(block) is GfxBlock:
+            blocks.append(("gfx", addr, block.bpp, len(block) // block.bpp))
+        elif type(block) is DataBlock:
+            blocks.append(("data", addr, block.format, block.amount))
+        else:
+            return None
+    cross = [(RomInfo.memoryKey(memory), target, RomInfo.memoryKey(from_memory), from_addr, instr.type, instr.size) for memory, target, from_memory, from_addr, instr in CodeBlock.cross_bank_targets]
+    statistics = CodeBlock.statistics
+    return blocks, labels, xrefs, cross, (statistics.entries, statistics.blocks, statistics.instructions, statistics.max_depth, statistics.time_per_bank)
+
+
+class _Recorder:
+    def __init__(self):
+        self.labels = []
+        self.xrefs = []
+
+    def autoLabel(self, memory, addr, source, type):
+        self.labels.append((RomInfo.memoryKey(memory), addr, source, type))
+
+    def xref(self, memory, addr, source_bank, source_addr, kind):
+        self.xrefs.append((RomInfo.memoryKey(memory), addr, source_bank, source_addr, kind))
+
+
+def _replayBlock(bank, block):
+    if block[0] == "code":
+        _, addr, size, no_label = block
+        CodeBlock(bank, addr, trace=False).resize(size)
+        for n in no_label:
+            bank.ensureNoLabel(n)
+    elif block[0] == "gfx":
+        _, addr, bpp, size = block
+        GfxBlock(bank, addr, bpp=bpp, size=size)
+    elif block[0] == "data":
+        _, addr, format, amount = block
+        DataBlock(bank, addr, format=format, amount=amount)
+
+
+def _mergeStatistics(worker_statistics):
+    entries, blocks, instructions, max_depth, time_per_bank = worker_statistics
+    statistics = CodeBlock.statistics
+    statistics.entries += entries
+    statistics.blocks += blocks
+    statistics.instructions += instructions
+    statistics.max_depth = max(statistics.max_depth, max_depth)
+    for bank_nr, seconds in time_per_bank.items():
+        statistics.time_per_bank[bank_nr] = statistics.time_per_bank.get(bank_nr, 0.0) + seconds
+
+
+# Same as what CodeBlock tracing does for a target that it reaches, but for a target found by a worker.
+def _traceCrossBankTarget(memory, target, from_memory, from_addr, instr_type, instr_size):
+    other_block = memory[target]
+    if other_block is None:
+        CodeBlock(memory, target)
+        other_block = memory[target]
+    elif isinstance(other_block, CodeBlock) and other_block.base_address == target:
+        if instr_type in (CALL, RST):
+            other_block.onCall(from_memory, from_addr, from_addr + instr_size)
+        else:
+            other_block.onJump(from_memory, from_addr, from_addr + instr_size)
+    if other_block is not None:
+        other_block.addAutoLabel(target, from_addr, instr_type)
@@ -0,0 +1,126 @@
+import contextlib
+import json
+import time
+import tracemalloc
+
+
+def _formatMemory(peak):
+    if peak is None:
+        return "-"
+    return "%.1f MB" % (peak / 1048576)
+
+
+class _Frame:
+    def __init__(self, name):
+        self.name = name
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.peak = 0
+
+
+# Records wall time and cpu time of the phases of a run, and of the items (banks, annotation handlers) within them.
+# Disabled unless enable() is called, then all calls are no-ops.
+# With memory=True the peak python memory use is recorded as well, with tracemalloc. Tracing every allocation slows
+# the run down many times over, so the times of such a run are not representative, measure those in a separate run.
+class Profiler:
+    __enabled = False
+    __memory = False
+    __stack = []
+    __phases = []
+    __items = {}
+
+    @classmethod
+    def enable(self, *, memory=False):
+        self.__enabled = True
+        self.__memory = memory
+        self.__stack = []
+        self.__phases = []
+        self.__items = {}
+        if memory:
+            tracemalloc.start()
+
+    @classmethod
+    def isEnabled(self):
+        return self.__enabled
+
+    # Initializer for pool workers: forked workers inherit tracemalloc, only keep it when memory use is measured.
+    @classmethod
+    def initWorker(self):
+        if not self.__memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # Time a phase of the run. Nested phases are named after their parent, like "process rom/annotations".
+    @classmethod
+    def phase(self, name):
+        if not self.__enabled:
+            return contextlib.nullcontext()
+        if self.__stack:
+            name = "%s/%s" % (self.__stack[-1].name, name)
+        return self.__measure(name, lambda frame, result: self.__phases.append(dict(name=frame.name, **result)))
+
+    # Time an item of a category, like a bank in "export bank". Items with the same name are added together.
+    @classmethod
+    def item(self, category, name):
+        if not self.__enabled:
+            return contextlib.nullcontext()
+        return self.__measure(self.__stack[-1].name if self.__stack else "", lambda frame, result: self.__addItem(category, name, result))
+
+    # Add an item that was measured somewhere else, like in a worker process.
+    @classmethod
+    def addItem(self, category, name, *, wall, cpu, peak_memory=None):
+        if self.__enabled:
+            self.__addItem(category, name, {"wall": wall, "cpu": cpu, "peak_memory": peak_memory})
+
+    @classmethod
+    @contextlib.contextmanager
+    def __measure(self, name, store):
+        if self.__memory:
+            if self.__stack:
+                # The peak is reset for every frame, so the parent keeps the peak up to now.
+                self.__stack[-1].peak = max(self.__stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        frame = _Frame(name)
+        self.__stack.append(frame)
+        try:
+            yield
+        finally:
+            self.__stack.pop()
+            wall = time.perf_counter() - frame.wall
+            cpu = time.process_time() - frame.cpu
+            peak = None
+            if self.__memory:
+                frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+                if self.__stack:
+                    self.__stack[-1].peak = max(self.__stack[-1].peak, frame.peak)
+                peak = frame.peak
+            store(frame, {"wall": wall, "cpu": cpu, "peak_memory": peak})
+
+    @classmethod
+    def __addItem(self, category, name, result):
+        items = self.__items.setdefault(category, {})
+        if name not in items:
+            items[name] = {"wall": 0.0, "cpu": 0.0, "peak_memory": None, "count": 0}
+        item = items[name]
+        item["wall"] += result["wall"]
+        item["cpu"] += result["cpu"]
+        if result["peak_memory"] is not None:
+            item["peak_memory"] = max(item["peak_memory"] or 0, result["peak_memory"])
+        item["count"] += 1
+
+    @classmethod
+    def writeReport(self, filename):
+        report = {"phases": self.__phases, "items": self.__items}
+        with open(filename, "wt") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    @classmethod
+    def printSummary(self):
+        print("Profile:")
+        print("  %-40s %9s %9s %11s" % ("phase", "wall", "cpu", "peak mem"))
+        for phase in sorted(self.__phases, key=lambda phase: phase["name"]):
+            print("  %-40s %8.3fs %8.3fs %11s" % (phase["name"], phase["wall"], phase["cpu"], _formatMemory(phase["peak_memory"])))
+        for category, items in sorted(self.__items.items()):
+            slowest = sorted(items.items(), key=lambda item: item[1]["wall"], reverse=True)[:10]
+            print("  Slowest %s (%d total):" % (category, len(items)))
+            for name, item in slowest:
+                print("    %-38s %8.3fs %8.3fs %11s  x%d" % (name, item["wall"], item["cpu"], _formatMemory(item["peak_memory"]), item["count"]))
@@ -1,9 +1,17 @@
 import hashlib
+import mmap
+import numpy
 
 
 class ROM:
-    def __init__(self, filename):
-        self.__data = open(filename, "rb").read()
+    # With use_mmap the file is mapped instead of read, and all access goes through a memoryview on the mapping.
+    def __init__(self, filename, *, use_mmap=False):
+        with open(filename, "rb") as f:
+            if use_mmap and f.seek(0, 2) > 0:
+                self.__data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                f.seek(0)
+                self.__data = f.read()
     
     def __getitem__(self, index):
         return self.__data[index]
@@ -11,8 +19,23 @@ class ROM:
     def __len__(self):
         return len(self.__data)
 
+    # The raw rom data, as bytes or a memoryview. Indexing it gives ints, slicing it does not copy for a memoryview.
+    def buffer(self):
+        return self.__data
+
+    # Zero-copy view on a part of the rom.
+    def view(self, offset, size):
+        return memoryview(self.__data)[offset:offset+size]
+
     def bankCount(self):
         return (len(self) + 0x3fff) // 0x4000
 
+    # The value of every byte of a bank that is only $00 or $FF padding, else None.
+    def bankFillByte(self, bank_nr):
+        data = numpy.frombuffer(self.view(bank_nr * 0x4000, 0x4000), dtype=numpy.uint8)
+        if len(data) == 0x4000 and data[0] in (0x00, 0xFF) and (data == data[0]).all():
+            return int(data[0])
+        return None
+
     def md5sum(self):
         return hashlib.md5(self.__data).hexdigest()
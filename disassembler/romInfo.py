@@ -13,7 +13,10 @@ from memory.io import IERegMemory
 class RomInfo:
     @classmethod
     def init(self, rom, wram_banks):
-        self.__rom_banks = [RomMemory(rom, bank) for bank in range(rom.bankCount())]
+        # Rom banks are created on first access, bank 0 is always needed.
+        self.__rom = rom
+        self.__rom_banks = [None] * rom.bankCount()
+        self.__rom_banks[0] = RomMemory(rom, 0)
         self.__vram = VRamMemory()
         self.__sram = SRamMemory()
         self.__wram = [WRamMemory()] if wram_banks == 1 else [WRamMemoryBanked(n) for n in range(wram_banks)]  
@@ -35,7 +38,27 @@ class RomInfo:
             return None
         if index >= len(self.__rom_banks):
             return None
-        return self.__rom_banks[index]
+        bank = self.__rom_banks[index]
+        if bank is None:
+            bank = RomMemory(self.__rom, index)
+            self.__rom_banks[index] = bank
+        return bank
+
+    @classmethod
+    def romBankCount(self):
+        return len(self.__rom_banks)
+
+    @classmethod
+    def hasRomBank(self, index):
+        return self.__rom_banks[index] is not None
+
+    # The rom banks that were created so far, without creating the others. Banks that are created while iterating
+    # are included when they come after the current bank.
+    @classmethod
+    def existingRomBanks(self):
+        for bank in self.__rom_banks:
+            if bank is not None:
+                yield bank
     
     @classmethod
     def getWRam(self, bankNum=0):
@@ -92,6 +115,56 @@ class RomInfo:
             return None
         return memory.getLabel(addr)
 
+    # All memories other than the rom banks.
+    @classmethod
+    def getOtherMemories(self):
+        return [self.__vram, self.__sram] + self.__wram + [self.__hram, self.__oam, self.__io, self.__ie]
+
+    # The existing rom banks and all other memories.
+    @classmethod
+    def getAllMemories(self):
+        return list(self.existingRomBanks()) + self.getOtherMemories()
+
+    # Key of a memory that is the same between runs and between processes, also for rom banks that do not exist yet.
+    @classmethod
+    def memoryKey(self, memory):
+        if isinstance(memory, RomMemory):
+            return ("rom", memory.bankNumber)
+        return ("memory", self.getOtherMemories().index(memory))
+
+    # The memory of a key from memoryKey, this creates the rom bank if needed.
+    @classmethod
+    def memoryByKey(self, key):
+        if key[0] == "rom":
+            return self.romBank(key[1])
+        return self.getOtherMemories()[key[1]]
+
+    @classmethod
+    def getState(self):
+        return {
+            "rom_banks": self.__rom_banks,
+            "vram": self.__vram,
+            "sram": self.__sram,
+            "wram": self.__wram,
+            "hram": self.__hram,
+            "oam": self.__oam,
+            "io": self.__io,
+            "ie": self.__ie,
+            "macros": self.macros,
+            "charmap": self.charmap,
+            "constants": self.constants,
+        }
+
     @classmethod
-    def getRomBanks(self):
-        return self.__rom_banks
+    def setState(self, state):
+        self.__rom_banks = state["rom_banks"]
+        self.__vram = state["vram"]
+        self.__sram = state["sram"]
+        self.__wram = state["wram"]
+        self.__hram = state["hram"]
+        self.__oam = state["oam"]
+        self.__io = state["io"]
+        self.__ie = state["ie"]
+        self.macros = state["macros"]
+        self.charmap = state["charmap"]
+        self.constants = state["constants"]
@@ -1,42 +1,135 @@
 import os
+import pickle
 import re
 
 from romInfo import RomInfo
 
 
+SOURCE_CACHE_VERSION = 1
+
+# Labels generated by the disassembler, these are generated again instead of being read back from the sources.
+AUTO_LABEL_RE = re.compile(r"\.?(?:call|jp|jr|rst|data|code|unknown)_|[hws][0-9A-F]{4}$")
+# The address in the ";; bb:aaaa" or ";; aaaa" comment at the end of every line of the export.
+ADDRESS_INFO_RE = re.compile(r"(?:[0-9a-fA-F]{2}:)?([0-9a-fA-F]{4})")
+SECTION_BANK_RE = re.compile(r"BANK\[\$([0-9a-f]+)\]")
+
+
+# Parsed sources from an earlier run, so unchanged files are not parsed again. A file is unchanged when it, and every file
+# that it includes, has the same modification time and size as when it was parsed.
+class SourceCache:
+    def __init__(self, filename):
+        self.__filename = filename
+        self.__entries = {}
+        self.__used = {}
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(filename):
+            return
+        try:
+            with open(filename, "rb") as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            print("Source cache: failed to load (%s)" % (e))
+            return
+        if cached.get("version") == SOURCE_CACHE_VERSION:
+            self.__entries = cached["entries"]
+
+    def get(self, key):
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        files, records = entry
+        for filename, mtime, size in files:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                self.misses += 1
+                return None
+            if stat.st_mtime_ns != mtime or stat.st_size != size:
+                self.misses += 1
+                return None
+        self.hits += 1
+        self.__used[key] = entry
+        return records
+
+    def put(self, key, files, records):
+        self.__used[key] = (files, records)
+
+    # Only the files read in this run are stored, so removed files do not stay in the cache.
+    def save(self):
+        if self.__used == self.__entries:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.__filename)), exist_ok=True)
+        tmp_filename = self.__filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            pickle.dump({"version": SOURCE_CACHE_VERSION, "entries": self.__used}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, self.__filename)
+
+
+# Reads the comments, labels and includes from a source file. The file is first parsed into a list of records,
+# which are then added to the memories, so the records can be cached and unchanged files do not need to be parsed again.
 class SourceReader:
-    def __init__(self, base_path):
+    def __init__(self, base_path, *, cache=None):
         self.__base_path = base_path
+        self.__cache = cache
         self.__memory = None
+        self.__records = None
+        self.__files = None
         self.__comments = []
         self.__inline_comment = None
         self.__label = None
         self.__include_start = []
         self.__include_end_count = 0
 
-    def readFile(self, filename):
+    # Files that are not the main file of their bank, like the parts of a split bank, are read with main=False.
+    def readFile(self, filename, *, main=True):
+        key = (os.path.abspath(os.path.join(self.__base_path, filename)), main)
+        records = self.__cache.get(key) if self.__cache is not None else None
+        if records is None:
+            self.__records = []
+            self.__files = []
+            self.__parseFile(filename, main)
+            records = self.__records
+            if self.__cache is not None:
+                self.__cache.put(key, self.__files, records)
+        for record in records:
+            if record[0] == "section":
+                self.__gotSection(record[1], record[2])
+            else:
+                self.__addAddressInfo(*record[1:])
+
+    def __parseFile(self, filename, main):
         print("Reading: ", filename)
-        f = open(os.path.join(self.__base_path, filename), "rt")
+        path = os.path.join(self.__base_path, filename)
+        stat = os.stat(path)
+        self.__files.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+        f = open(path, "rt")
         for line in f:
             if line.startswith("SECTION"):
-                self.__setMemoryTypeFromSection(line)
-                if self.__memory:
-                    self.__memory.main_filename = filename
-            if ";" in line:
-                self.__gotComment(line[line.find(";")+1:].rstrip())
-            if ";;" in line:
-                self.__gotAddressInfo(line[line.rfind(";;")+2:].strip())
-            if ";" in line:
-                line = line[:line.find(";")]
-            if line.rstrip().endswith(":"):
-                self.__gotLabel(line.rstrip()[:-1])
-            if line.startswith("INCLUDE \"") and line.rstrip().endswith("\""):
-                inc = line.rstrip()[9:-1]
+                self.__records.append(("section", line, filename if main else None))
+            comment_start = line.find(";")
+            if comment_start >= 0:
+                self.__gotComment(line[comment_start+1:].rstrip())
+                info_start = line.rfind(";;")
+                if info_start >= 0:
+                    self.__gotAddressInfo(line[info_start+2:].strip())
+                line = line[:comment_start]
+            line = line.rstrip()
+            if line.endswith(":"):
+                self.__gotLabel(line[:-1])
+            if line.startswith("INCLUDE \"") and line.endswith("\""):
+                inc = line[9:-1]
                 if not inc.startswith("include/"):
                     self.__include_start.append(inc)
-                    self.readFile(os.path.join("src", inc))
+                    self.__parseFile(os.path.join("src", inc), True)
                     self.__include_end_count += 1
 
+    def __gotSection(self, line, main_filename):
+        self.__setMemoryTypeFromSection(line)
+        if self.__memory and main_filename is not None:
+            self.__memory.main_filename = main_filename
+
     def __setMemoryTypeFromSection(self, line):
         section_type = line.strip().split(",")[1].strip().upper()
         if "[" in section_type:
@@ -45,12 +138,12 @@ class SourceReader:
         if section_type == "ROM0":
             self.__memory = RomInfo.romBank(0)
         elif section_type == "ROMX":
-            bank_nr = int(re.search(r"BANK\[\$([0-9a-f]+)\]", line.strip().split(",")[2]).group(1), 16)
+            bank_nr = int(SECTION_BANK_RE.search(line.strip().split(",")[2]).group(1), 16)
             self.__memory = RomInfo.romBank(bank_nr)
         elif section_type == "WRAM0":
             self.__memory = RomInfo.getWRam()
         elif section_type == "WRAMX":
-            wram_bank_nr = int(re.search(r"BANK\[\$([0-9a-f]+)\]", line.strip().split(",")[2]).group(1), 16)
+            wram_bank_nr = int(SECTION_BANK_RE.search(line.strip().split(",")[2]).group(1), 16)
             self.__memory = RomInfo.getWRam(wram_bank_nr)
         elif section_type == "SRAM":
             self.__memory = RomInfo.getSRam()
@@ -79,41 +172,34 @@ class SourceReader:
     def __gotLabel(self, label):
         if not label.startswith("."):
             self.__prev_label = label
-        if label.startswith("call_") or label.startswith("jp_") or label.startswith("jr_") or label.startswith("rst_") or label.startswith("data_"):
-            return
-        if label.startswith(".call_") or label.startswith(".jp_") or label.startswith(".jr_") or label.startswith(".rst_") or label.startswith(".data_"):
-            return
-        if label.startswith("code_") or label.startswith(".code_"):
-            return
-        if label.startswith("unknown_") or label.startswith(".unknown_"):
-            return
-        if re.match(r"^[hws][0-9A-F]{4}$", label):
+        if AUTO_LABEL_RE.match(label):
             return
         if label.startswith("."):
             label = self.__prev_label.split(".")[0] + label
         self.__label = label
-    
+
     def __gotAddressInfo(self, info):
-        m = re.match(r"[0-9a-fA-F]{2}:([0-9a-fA-F]{4})", info)
+        m = ADDRESS_INFO_RE.match(info)
         if not m:
-            m = re.match(r"([0-9a-fA-F]{4})", info)
-            if not m:
-                return
+            return
         addr = int(m.group(1), 16)
 
-        for comment in self.__comments:
-            self.__memory.addComment(addr, comment)
-        if self.__inline_comment is not None:
-            self.__memory.addInlineComment(addr, self.__inline_comment)
-        if self.__label is not None:
-            self.__memory.addLabel(addr, self.__label)
-        if self.__include_start is not None:
-            for inc in self.__include_start:
-                self.__memory.startInclude(addr, inc)
+        if self.__comments or self.__inline_comment is not None or self.__label is not None or self.__include_start or self.__include_end_count > 0:
+            self.__records.append(("address", addr, self.__comments, self.__inline_comment, self.__label, self.__include_start, self.__include_end_count))
+            self.__comments = []
+            self.__inline_comment = None
+            self.__label = None
             self.__include_start = []
-        if self.__include_end_count > 0:
-            self.__memory.endInclude(addr, self.__include_end_count)
             self.__include_end_count = 0
-        self.__comments = []
-        self.__inline_comment = None
-        self.__label = None
+
+    def __addAddressInfo(self, addr, comments, inline_comment, label, include_start, include_end_count):
+        for comment in comments:
+            self.__memory.addComment(addr, comment)
+        if inline_comment is not None:
+            self.__memory.addInlineComment(addr, inline_comment)
+        if label is not None:
+            self.__memory.addLabel(addr, label)
+        for inc in include_start:
+            self.__memory.startInclude(addr, inc)
+        if include_end_count > 0:
+            self.__memory.endInclude(addr, include_end_count)
@@ -85,11 +85,19 @@ void coreLoop(uint32_t max_cycles)
     }
 }
 
+void dumpInstrumentation(FILE* f)
+{
+    card.dumpInstrumentation(f);
+    ram.dumpInstrumentation(f);
+    video.dumpInstrumentation(f);
+}
+
 void usage(const char* app)
 {
     fprintf(stderr, "Usage: %s rom.gb[c] [options]\n", app);
     fprintf(stderr, "Options:\n");
     fprintf(stderr, "  -o <instrumentation_file>            Write an instrumentation file from this run.\n");
+    fprintf(stderr, "  -z                                   Write the instrumentation file in the sparse format.\n");
     fprintf(stderr, "  -r <replay_file>                     Use the given replay file default for recording.\n");
     fprintf(stderr, "  -p                                   Play back the replay file.\n");
     fprintf(stderr, "  -s <screenshot>                      Save a screenshot on exit.\n");
@@ -102,6 +110,7 @@ int main(int argc, char** argv)
     std::string output_instrumentation_file;
     std::string replay_file;
     bool replay_playback = false;
+    bool sparse_instrumentation = false;
     const char* ezflash = nullptr;
     const char* screenshot = nullptr;
     uint32_t max_cycles = 0;
@@ -112,9 +121,9 @@ int main(int argc, char** argv)
     }
 
 #ifndef __GLIBC__
-    const char* getopt_opts = "o:r:pe:s:c:S:";
+    const char* getopt_opts = "o:zr:pe:s:c:S:";
 #else
-    const char* getopt_opts = "-o:r:pe:s:c:S:";
+    const char* getopt_opts = "-o:zr:pe:s:c:S:";
 #endif
 
     int c;
@@ -124,6 +133,7 @@ int main(int argc, char** argv)
         {
         case 1: rom_file = optarg; break;
         case 'o': output_instrumentation_file = optarg; break;
+        case 'z': sparse_instrumentation = true; break;
         case 'r': replay_file = optarg; break;
         case 'p': replay_playback = true; break;
         case 's': screenshot = optarg; break;
@@ -152,18 +162,40 @@ int main(int argc, char** argv)
     fprintf(stderr, "Done: %02x:%04x:%02x:%d\n", card.mbc->getRomBankNr(), cpu.pc, mm::get(cpu.pc).get(), cpu.halt);
     fprintf(stderr, "SP:%04x A:%02x BC:%04x DE:%04x HL:%04x F:%c%c%c%c\n", cpu.getSP(), cpu.A.get(), cpu.getBC(), cpu.getDE(), cpu.getHL(), cpu.F.Z ? 'Z' : ' ', cpu.F.N ? 'N' : ' ', cpu.F.H ? 'H' : ' ', cpu.F.C ? 'C' : ' ');
 
+    int result = 0;
     if (!output_instrumentation_file.empty())
     {
         FILE* f = fopen(output_instrumentation_file.c_str(), "wb");
-        if (f)
+        if (!f)
+        {
+            fprintf(stderr, "Failed to open instrumentation file: %s\n", output_instrumentation_file.c_str());
+            result = 1;
+        }
+        else if (sparse_instrumentation)
+        {
+            // The dense records are dumped into a temporary file first, and then packed into the sparse file.
+            FILE* dense = tmpfile();
+            if (!dense)
+            {
+                fprintf(stderr, "Failed to create temporary file for sparse instrumentation\n");
+                result = 1;
+            }
+            else
+            {
+                dumpInstrumentation(dense);
+                rewind(dense);
+                writeSparseInstrumentation(dense, f);
+                fclose(dense);
+            }
+            fclose(f);
+        }
+        else
         {
-            card.dumpInstrumentation(f);
-            ram.dumpInstrumentation(f);
-            video.dumpInstrumentation(f);
+            dumpInstrumentation(f);
             fclose(f);
         }
     }
     if (screenshot)
         video.screenshot(screenshot);
-    return 0;
+    return result;
 }
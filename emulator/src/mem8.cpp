@@ -1,6 +1,8 @@
 #include "mem8.h"
 #include "card.h"
 
+#include <string.h>
+
 
 void Mem8::set(uint8_t value)
 {
@@ -41,3 +43,44 @@ void Mem8::dumpInstrumentation(FILE* f) const
     fwrite(&id, sizeof(id), 1, f);
     fwrite(&used_as, sizeof(used_as), 1, f);
 }
+
+static void writeVarint(FILE* f, uint64_t value)
+{
+    uint8_t buffer[10];
+    int size = 0;
+    do {
+        buffer[size] = value & 0x7F;
+        value >>= 7;
+        if (value)
+            buffer[size] |= 0x80;
+        size++;
+    } while(value);
+    fwrite(buffer, size, 1, f);
+}
+
+void writeSparseInstrumentation(FILE* dense, FILE* sparse)
+{
+    std::vector<uint64_t> ids;
+    std::vector<uint64_t> used_as;
+    uint64_t record[2];
+    while(fread(record, sizeof(record), 1, dense) == 1)
+    {
+        if (!record[1])
+            continue;
+        ids.push_back(record[0]);
+        used_as.push_back(record[1]);
+    }
+
+    uint8_t header[16] = {'B', 'B', 'I', 'S', 1, 0, 0, 0};
+    uint64_t count = ids.size();
+    memcpy(header + 8, &count, sizeof(count));
+    fwrite(header, sizeof(header), 1, sparse);
+    uint64_t previous = 0;
+    for(auto id : ids)
+    {
+        int64_t delta = int64_t(id - previous);
+        writeVarint(sparse, (uint64_t(delta) << 1) ^ uint64_t(delta >> 63));
+        previous = id;
+    }
+    fwrite(used_as.data(), sizeof(uint64_t), used_as.size(), sparse);
+}
@@ -39,6 +39,11 @@ public:
     virtual void setImpl(uint8_t) = 0;
 };
 
+// Convert a file of dense (id, used_as) records into the sparse instrumentation format:
+// "BBIS", u8 version, u8 compression (0: none), u16 reserved, u64 record count,
+// followed by the zigzag LEB128 encoded id deltas, and then the used_as values.
+void writeSparseInstrumentation(FILE* dense, FILE* sparse);
+
 template<typename T> class Mem8Block : public std::vector<T>
 {
 public:
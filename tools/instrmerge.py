@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import numpy
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "disassembler"))
+from instrumentationFile import RECORD_DTYPE, COMPRESSION_NAMES, readInstrumentation, writeSparseInstrumentation
+
+
+ID_MASK = (0xFF << 32)
+ID_ROM = (0x00 << 32)
+MARK_MASK = (0xFF << 40)
+MARK_INSTR = (0x01 << 40)
+MARK_DATA = (0x02 << 40)
+MARK_BANK_MASK = (0xFFF << 48)
+# The id and address of what the byte was used as, everything in used_as below the marks.
+USED_AS_MASK = (1 << 40) - 1
+
+
+# Merge records into the already merged records, which are sorted by source with every source only once.
+# The marks of records with the same source are OR'ed together, for the bank and the used as id/address
+# the last non-zero value is taken, as those cannot be combined.
+def merge(merged, records):
+    records = records[records["used_as"] != 0]
+    source = numpy.concatenate((merged["source"], records["source"]))
+    used_as = numpy.concatenate((merged["used_as"], records["used_as"]))
+    unique, inverse = numpy.unique(source, return_inverse=True)
+
+    marks = numpy.zeros(len(unique), dtype=numpy.uint64)
+    numpy.bitwise_or.at(marks, inverse, used_as & numpy.uint64(MARK_MASK))
+    result = numpy.zeros(len(unique), dtype=RECORD_DTYPE)
+    result["source"] = unique
+    result["used_as"] = marks
+    for mask in (MARK_BANK_MASK, USED_AS_MASK):
+        field = used_as & numpy.uint64(mask)
+        values = numpy.zeros(len(unique), dtype=numpy.uint64)
+        # Later entries win when the same index is assigned multiple times.
+        values[inverse[field != 0]] = field[field != 0]
+        result["used_as"] |= values
+    return result
+
+
+# Rom offsets that are marked with the given mark.
+def coverage(records, mark):
+    is_rom = (records["source"] & numpy.uint64(ID_MASK)) == ID_ROM
+    selected = is_rom & ((records["used_as"] & numpy.uint64(mark)) != 0)
+    return records["source"][selected] & numpy.uint64(0xFFFFFFFF)
+
+
+def bankCounts(offsets):
+    return numpy.bincount((offsets >> numpy.uint64(14)).astype(numpy.int64))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge instrumentation files into a single file, and report what each file adds to the coverage.")
+    parser.add_argument("input", nargs="+")
+    parser.add_argument("--output", type=str, required=True)
+    parser.add_argument("--compression", choices=sorted(COMPRESSION_NAMES.keys()), default="zlib")
+    parser.add_argument("--dense", action="store_true", help="Write the old dense format instead of the sparse format")
+    args = parser.parse_args()
+
+    merged = numpy.zeros(0, dtype=RECORD_DTYPE)
+    for filename in args.input:
+        records = readInstrumentation(filename)
+        before = {mark: coverage(merged, mark) for mark in (MARK_INSTR, MARK_DATA)}
+        merged = merge(merged, records)
+        new = {mark: numpy.setdiff1d(coverage(merged, mark), before[mark], assume_unique=True) for mark in (MARK_INSTR, MARK_DATA)}
+        print("%s: %d records, %d new code bytes, %d new data bytes" % (filename, len(records), len(new[MARK_INSTR]), len(new[MARK_DATA])))
+        code_per_bank = bankCounts(new[MARK_INSTR])
+        data_per_bank = bankCounts(new[MARK_DATA])
+        for bank in range(max(len(code_per_bank), len(data_per_bank))):
+            code = code_per_bank[bank] if bank < len(code_per_bank) else 0
+            data = data_per_bank[bank] if bank < len(data_per_bank) else 0
+            if code or data:
+                print("  bank %02x: +%d code, +%d data" % (bank, code, data))
+
+    if args.dense:
+        merged.tofile(args.output)
+    else:
+        writeSparseInstrumentation(args.output, merged, compression=COMPRESSION_NAMES[args.compression])
+    print("Wrote %d records to %s" % (len(merged), args.output))
+
+
+if __name__ == "__main__":
+    main()
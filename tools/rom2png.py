@@ -1,8 +1,12 @@
 import argparse
+import os
+import sys
 import PIL.Image
 import PIL.ImageDraw
 import numpy
-import struct
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "disassembler"))
+from instrumentationFile import readInstrumentation
 
 
 ID_MASK = (0xFF << 32)
@@ -92,30 +96,18 @@ if __name__ == "__main__":
     data = open(args.rom, "rb").read()
     bank_count = len(data) // 0x4000
     data_type = bytearray(len(data))
+    types = numpy.frombuffer(data_type, dtype=numpy.uint8)
     for filename in args.instrumentation:
-        f = open(filename, "rb")
-        while True:
-            record = f.read(16)
-            if not record:
-                break
-            source, used_as = struct.unpack("<QQ", record)
-            if (source & ID_MASK) == ID_ROM:
-                if used_as & MARK_DATA:
-                    data_type[source & 0xFFFFFFFF] = 2
-                if used_as & MARK_INSTR:
-                    data_type[source & 0xFFFFFFFF] = 1
+        records = readInstrumentation(filename)
+        records = records[(records["source"] & ID_MASK) == ID_ROM]
+        is_instr = (records["used_as"] & MARK_INSTR) != 0
+        used = is_instr | ((records["used_as"] & MARK_DATA) != 0)
+        types[(records["source"][used] & 0xFFFFFFFF).astype(numpy.int64)] = numpy.where(is_instr[used], 1, 2)
     for filename in args.no_instrumentation:
-        f = open(filename, "rb")
-        while True:
-            record = f.read(16)
-            if not record:
-                break
-            source, used_as = struct.unpack("<QQ", record)
-            if (source & ID_MASK) == ID_ROM:
-                if used_as & MARK_DATA:
-                    data_type[source & 0xFFFFFFFF] = 0
-                if used_as & MARK_INSTR:
-                    data_type[source & 0xFFFFFFFF] = 0
+        records = readInstrumentation(filename)
+        records = records[(records["source"] & ID_MASK) == ID_ROM]
+        used = (records["used_as"] & (MARK_INSTR | MARK_DATA)) != 0
+        types[(records["source"][used] & 0xFFFFFFFF).astype(numpy.int64)] = 0
 
     if args.diff:
         diff = open(args.diff, "rb").read()